@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+# Bulk generation: read {prompt, language} tasks from JSONL, fan them out with
+# bounded concurrency and yield results in completion order. Finished items
+# are appended to a checkpoint file together with a fingerprint of what was
+# generated (the cache key of prompt, language, model and prompt template),
+# so a rerun skips exactly the tasks whose inputs have not changed.
+#
+#   python batch.py tasks.jsonl -o results.jsonl --concurrency 4
+#
+# For the CLI the output file doubles as the checkpoint.
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_RETRIES = int(os.getenv("BATCH_RETRIES", "2"))
+BATCH_CHECKPOINT_DIR = os.getenv(
+    "BATCH_CHECKPOINT_DIR", str(Path(__file__).resolve().parents[1] / ".cache" / "batches")
+)
+
+
+def task_error(task):
+    """Why `task` cannot be generated, or None."""
+    prompt = task.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        return "task needs a non-empty string 'prompt'"
+    if not isinstance(task["language"], str) or not task["language"].strip():
+        return "'language' must be a non-empty string"
+    if isinstance(task["id"], bool) or not isinstance(task["id"], (str, int)):
+        return "'id' must be a string or an integer"
+    return None
+
+
+def read_tasks(lines):
+    """Tasks from JSONL lines. `id` defaults to the 1-based line number.
+
+    Lines that are not valid task objects, or that reuse an earlier id, become
+    tasks carrying an `error`, so they show up in the results instead of
+    silently disappearing (or resuming another task's result).
+    """
+    seen = set()
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            task = json.loads(line)
+        except ValueError as e:
+            yield {"id": number, "error": f"invalid JSON: {e}"}
+            continue
+        if not isinstance(task, dict):
+            yield {"id": number, "error": "task must be a JSON object"}
+            continue
+        task.setdefault("id", number)
+        task.setdefault("language", "python")
+        error = task_error(task)
+        if error:
+            yield {"id": number, "error": error}
+            continue
+        if str(task["id"]) in seen:
+            yield {"id": task["id"], "error": f"duplicate id {task['id']!r} on line {number}"}
+            continue
+        seen.add(str(task["id"]))
+        yield task
+
+
+class Checkpoint:
+    """Append-only JSONL of successful results, keyed by task id.
+
+    When an id appears more than once (a rerun after the prompt or model
+    changed), the latest successful row wins.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.completed = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from an interrupted run
+                    if result.get("ok"):
+                        self.completed[str(result["id"])] = result
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() and not self.path.read_bytes().endswith(b"\n"):
+            self._file.write("\n")  # don't glue the next row onto a torn one
+
+    def done(self, task_id, fingerprint):
+        """Whether `task_id` already succeeded with the same inputs."""
+        result = self.completed.get(str(task_id))
+        return result is not None and result.get("fingerprint") == fingerprint
+
+    def record(self, result):
+        self._file.write(json.dumps(result) + "\n")
+        self._file.flush()
+        if result.get("ok"):
+            self.completed[str(result["id"])] = result
+
+    def close(self):
+        self._file.close()
+
+
+def checkpoint_path(job_id):
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", job_id)
+    return Path(BATCH_CHECKPOINT_DIR) / f"{safe}.jsonl"
+
+
+async def run_task(task, generate, retries=BATCH_RETRIES, fingerprint=None):
+    result = {"id": task["id"], "prompt": task.get("prompt", ""), "language": task.get("language", "")}
+    if "error" in task:
+        return {**result, "ok": False, "error": task["error"]}
+    if fingerprint is not None:
+        result["fingerprint"] = fingerprint
+    started = time.monotonic()
+    for attempt in range(retries + 1):
+        try:
+            output, cached = await generate(task["prompt"], task["language"])
+            return {**result, "ok": True, "result": output, "cached": cached,
+                    "duration": round(time.monotonic() - started, 3)}
+        except Exception as e:
+            if attempt == retries:
+                return {**result, "ok": False, "error": str(e),
+                        "duration": round(time.monotonic() - started, 3)}
+            # Honour the scheduler's Retry-After when it is the one pushing back.
+            await asyncio.sleep(getattr(e, "retry_after", None) or 2 ** attempt)
+
+
+async def run_batch(tasks, generate, concurrency=4, checkpoint=None, replay=False, fingerprint=None):
+    """Yield one result dict per task, in completion order.
+
+    `generate(prompt, language)` must return (output, cached), and
+    `fingerprint(prompt, language)` identifies what it would generate (the
+    cache key). Tasks whose id is in `checkpoint` with the same fingerprint
+    are skipped, or re-emitted unchanged with `replay=True`; without a
+    fingerprint nothing is skipped. Closing the generator early cancels the
+    in-flight tasks.
+    """
+    todo = iter(tasks)
+    results = asyncio.Queue()
+
+    async def process(task):
+        key = None
+        if fingerprint is not None and "error" not in task:
+            key = fingerprint(task["prompt"], task["language"])
+        if checkpoint is not None and key is not None and checkpoint.done(task["id"], key):
+            return {**checkpoint.completed[str(task["id"])], "resumed": True} if replay else None
+        result = await run_task(task, generate, fingerprint=key)
+        if checkpoint is not None:
+            checkpoint.record(result)
+        return result
+
+    async def worker():
+        try:
+            for task in todo:  # shared iterator: each task is taken once
+                try:
+                    result = await process(task)
+                except Exception as e:
+                    # One bad task must not take the worker (and its queue share) down.
+                    result = {"id": task.get("id"), "prompt": task.get("prompt", ""),
+                              "language": task.get("language", ""), "ok": False, "error": str(e)}
+                if result is not None:
+                    await results.put(result)
+        finally:
+            await results.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    remaining = len(workers)
+    try:
+        while remaining:
+            result = await results.get()
+            if result is None:
+                remaining -= 1
+                continue
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        # Surface worker crashes (not cancellations) instead of losing them.
+        for outcome in await asyncio.gather(*workers, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                raise outcome
+
+
+async def main(args):
+    import model_client
+
+    model_client.http_client = model_client.create_http_client()
+    # This process is the only client, so let the scheduler run as wide as asked.
+    model_client.scheduler.max_in_flight = args.concurrency
+
+    async def generate(prompt, language):
+        result, cached, _ = await model_client.generate_cached(
+            prompt, language, client_id="batch", no_cache=args.no_cache
+        )
+        return result, cached
+
+    checkpoint = Checkpoint(args.output)
+    ok = failed = skipped = 0
+    try:
+        with open(args.tasks, encoding="utf-8") as f:
+            tasks = read_tasks(f)
+            async for result in run_batch(tasks, generate, args.concurrency, checkpoint,
+                                          replay=True, fingerprint=model_client.cache_key):
+                if result.get("resumed"):
+                    skipped += 1
+                    continue
+                if result["ok"]:
+                    ok += 1
+                else:
+                    failed += 1
+                status = "ok" if result["ok"] else f"FAILED: {result['error']}"
+                print(f"[{ok + failed}] {result['id']}: {status}", flush=True)
+    finally:
+        checkpoint.close()
+        await model_client.http_client.aclose()
+    print(f"Done: {ok} generated, {failed} failed, {skipped} already in {args.output}.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate scripts for every task in a JSONL file.")
+    parser.add_argument("tasks", help="JSONL file with one {\"prompt\", \"language\", \"id\"?} per line")
+    parser.add_argument("-o", "--output", default="results.jsonl",
+                        help="results JSONL; also the checkpoint a rerun resumes from")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--no-cache", action="store_true", help="regenerate even if cached")
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
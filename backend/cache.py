@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Generation cache shared by the FastAPI backend and the Streamlit frontend.
+# Two tiers: a small in-memory LRU in front of a SQLite file that survives
+# restarts. Both tiers honour the same TTL. Stdlib only, so the frontend can
+# import it as `backend.cache` without pulling in the backend's dependencies.
+
+DEFAULT_PATH = Path(__file__).resolve().parents[1] / ".cache" / "generations.sqlite3"
+
+CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", str(DEFAULT_PATH))
+CACHE_MEMORY_ENTRIES = int(os.getenv("GENERATION_CACHE_MEMORY_ENTRIES", "256"))
+CACHE_DISK_ENTRIES = int(os.getenv("GENERATION_CACHE_DISK_ENTRIES", "5000"))
+CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+
+def make_key(prompt, language, model, template):
+    """Hash of the normalized (prompt, language, model, template) tuple.
+
+    `template` is the prompt template text itself, so callers that phrase the
+    request differently never share entries, and editing a template makes its
+    old generations miss.
+    """
+    parts = [
+        normalize_prompt(prompt),
+        language.strip().lower(),
+        model.strip().lower(),
+        template,
+    ]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    def __init__(self, path=CACHE_PATH, memory_entries=CACHE_MEMORY_ENTRIES,
+                 disk_entries=CACHE_DISK_ENTRIES, ttl=CACHE_TTL):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (created, value)
+        # Hits not yet written to the disk tier's `accessed` column. Flushed
+        # with the next write, before eviction, so reads never commit.
+        self._touched = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # WAL stays consistent without an fsync per commit; at worst a
+            # crash loses the last few cache writes.
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self._touched[key] = now
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM generations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._touched[key] = now
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is None:
+                return
+            self._touched.pop(key, None)
+            self._db.execute(
+                "INSERT OR REPLACE INTO generations (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._flush_touched()
+            self._evict(now)
+            self._db.commit()
+
+    def flush(self):
+        """Persist pending hit times (e.g. before shutdown)."""
+        with self._lock:
+            if self._db is not None and self._touched:
+                self._flush_touched()
+                self._db.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE generations SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self, now):
+        if self.ttl > 0:
+            self._db.execute("DELETE FROM generations WHERE created < ?", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM generations").fetchone()
+        if count > self.disk_entries:
+            self._db.execute(
+                "DELETE FROM generations WHERE key IN "
+                "(SELECT key FROM generations ORDER BY accessed ASC LIMIT ?)",
+                (count - self.disk_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM generations")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
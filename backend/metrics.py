@@ -0,0 +1,312 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal Prometheus-compatible metrics plus optional tracing hooks. Stdlib
+# only, so the Streamlit frontend can record into the same metrics via
+# `backend.metrics`.
+
+# `language` comes straight from requests; anything outside this set is
+# reported as "other" so clients cannot create unbounded label series.
+LANGUAGE_LABELS = {
+    "python": "python", "py": "python",
+    "bash": "bash", "sh": "bash", "shell": "bash",
+    "javascript": "javascript", "js": "javascript", "node": "javascript",
+    "powershell": "powershell", "pwsh": "powershell", "ps1": "powershell",
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+
+def language_label(language):
+    language = str(language or "").strip().lower()
+    return LANGUAGE_LABELS.get(language, "other") if language else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labels, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """`collect()` returns extra exposition lines (e.g. current gauges)."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+def sample(name, help, value, kind="gauge"):
+    """Exposition lines for a single unlabelled value, for Registry collectors."""
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "generation_stage_seconds",
+    "Time spent per generation stage (cache_lookup, queue_wait, upstream, connect, "
+    "ttft, prompt_eval, generation, json_decode, health_probe, model_preload, total).",
+    labels=("stage", "backend", "language"),
+))
+REQUESTS = REGISTRY.register(Counter(
+    "generation_requests_total",
+    "Generation requests by outcome (ok, cached, error, rejected).",
+    labels=("backend", "language", "outcome"),
+))
+TOKENS = REGISTRY.register(Counter(
+    "generation_tokens_total",
+    "Tokens reported by the model (eval_count / prompt_eval_count).",
+    labels=("backend", "kind"),
+))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "generation_tokens_per_second",
+    "Decode speed per request, eval_count / eval_duration.",
+    labels=("backend",),
+    buckets=RATE_BUCKETS,
+))
+
+
+# ---- tracing ----
+_tracer = None
+
+
+def set_tracer(tracer):
+    """Install `tracer(name, attributes, parent)` -> context manager, or None to disable.
+
+    The context manager yields a span object (passed back as `parent` for
+    child spans). Parents are explicit because a request may finish in a
+    different task or thread than the one it started in.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def span(name, parent=None, **attributes):
+    return _tracer(name, attributes, parent) if _tracer is not None else nullcontext()
+
+
+def use_opentelemetry():
+    """Route spans to OpenTelemetry when it is installed. Returns True on success."""
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return False
+    tracer = trace.get_tracer("ai-script-generator")
+
+    @contextmanager
+    def otel_span(name, attributes, parent):
+        # Not made "current": entering and leaving the context in different
+        # tasks would corrupt OpenTelemetry's context stack.
+        context = trace.set_span_in_context(parent) if parent is not None else None
+        current = tracer.start_span(name, context=context, attributes=attributes)
+        try:
+            yield current
+        except BaseException as e:
+            current.record_exception(e)
+            current.set_status(trace.Status(trace.StatusCode.ERROR, str(e)))
+            raise
+        finally:
+            current.end()
+
+    set_tracer(otel_span)
+    return True
+
+
+if os.getenv("TRACING", "").lower() in ("otel", "opentelemetry"):
+    use_opentelemetry()
+
+
+# ---- per-request timing ----
+class Stage:
+    """A timed stage that can end somewhere other than where it began."""
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.started = time.perf_counter()
+        self._span = span(name, parent=trace.span, backend=trace.backend, language=trace.language)
+        self._span.__enter__()
+        self.ended = False
+        trace._open.append(self)
+
+    def end(self, record=True):
+        """Close the span; `record=False` keeps the time out of the metrics."""
+        if self.ended:
+            return
+        self.ended = True
+        self.trace._open.remove(self)
+        if record:
+            self.trace.add(self.name, time.perf_counter() - self.started)
+        self._span.__exit__(None, None, None)
+
+
+class RequestTrace:
+    """Collects stage timings for one generation and records them at finish().
+
+    Also holds the request's parent span, opened here and closed in finish(),
+    so every stage span nests under one span per request.
+    """
+
+    def __init__(self, backend, language):
+        self.backend = backend
+        self.language = language_label(language)
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.finished = False
+        self._open = []  # stages started but not ended yet
+        self._span = span("generation_request", backend=backend, language=self.language)
+        self.span = self._span.__enter__()
+
+    def start_stage(self, name):
+        return Stage(self, name)
+
+    @contextmanager
+    def stage(self, name):
+        current = self.start_stage(name)
+        try:
+            yield
+        finally:
+            current.end()
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def first_token(self):
+        if "ttft" not in self.stages:
+            self.stages["ttft"] = time.perf_counter() - self.started
+
+    def ollama_stats(self, data):
+        """Record the timing fields of Ollama's final (`done`) chunk."""
+        if data.get("prompt_eval_duration"):
+            self.add("prompt_eval", data["prompt_eval_duration"] / 1e9)
+        if data.get("prompt_eval_count"):
+            TOKENS.inc(data["prompt_eval_count"], backend=self.backend, kind="prompt")
+        if data.get("eval_duration"):
+            self.add("generation", data["eval_duration"] / 1e9)
+        if data.get("eval_count"):
+            TOKENS.inc(data["eval_count"], backend=self.backend, kind="generated")
+            if data.get("eval_duration"):
+                rate = data["eval_count"] / (data["eval_duration"] / 1e9)
+                TOKENS_PER_SECOND.observe(rate, backend=self.backend)
+
+    def finish(self, outcome):
+        if self.finished:
+            return
+        self.finished = True
+        # Stages that never got to end (rejections, coalesced waits) close
+        # their spans before the request span, without being recorded.
+        for stage in reversed(self._open):
+            stage.end(record=False)
+        self.stages["total"] = time.perf_counter() - self.started
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=stage, backend=self.backend, language=self.language)
+        REQUESTS.inc(backend=self.backend, language=self.language, outcome=outcome)
+        if hasattr(self.span, "set_attribute"):
+            self.span.set_attribute("outcome", outcome)
+        self._span.__exit__(None, None, None)
+
+
+def observe_stage(stage, seconds, backend="", language=""):
+    STAGE_SECONDS.observe(seconds, stage=stage, backend=backend, language=language_label(language))
+
+
+# ---- standalone exporter (for processes without a web framework) ----
+def start_http_server(port, host="0.0.0.0"):
+    """Serve REGISTRY at http://host:port/metrics on a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
@@ -1,41 +1,606 @@
-import requests, json
+import asyncio
+import hmac
+import json
+import logging
+import os
+import time
+from contextlib import aclosing, asynccontextmanager
+
+import httpx
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from batch import BATCH_MAX_CONCURRENCY, Checkpoint, checkpoint_path, read_tasks, run_batch
+from cache import GenerationCache, make_key
+from metrics import REGISTRY, RequestTrace, observe_stage, sample
+from sandbox_runner import SANDBOX_ENABLED, SANDBOX_TIMEOUT, SANDBOX_TOKEN, SandboxPool
+from scheduler import QueueFull, Scheduler
+from sessions import SessionStore
+from stream_parser import ScriptResponseParser, loads, parse_script_response
+
+
+# ---------------- CONFIG ----------------
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "codellama:7b")
+
+# One pooled client is shared by every request on the worker.
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "64"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+# Max gap between two streamed chunks (covers model load + prompt eval on CPU).
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+
+# How long Ollama keeps the model loaded after a request ("30m", "24h", or
+# seconds; -1 keeps it resident until Ollama restarts).
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Load the model at backend startup instead of on the first user request.
+OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "1").lower() not in ("0", "false", "no")
+
+# Part of the cache key, so changing it (or the frontend's templates, which
+# share the cache file) never serves answers written for another prompt.
+PROMPT_TEMPLATE = "Write a {language} script for this task: {prompt}"
+# ----------------------------------------
+
+STARTED_AT = time.time()
+logger = logging.getLogger(__name__)
+
+http_client = None
+generation_cache = GenerationCache()
+scheduler = Scheduler()
+sandbox_pool = SandboxPool()
+sessions = SessionStore()
+
+
+def create_http_client():
+    return httpx.AsyncClient(
+        base_url=OLLAMA_BASE_URL,
+        timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+        ),
+    )
+
+
+def keep_alive():
+    # Ollama wants a number for plain seconds and a string for durations.
+    try:
+        return int(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE
 
 
-app = FastAPI()
+async def preload_model():
+    """Load the model into Ollama now so the first request skips the cold load.
+
+    A generate call without a prompt only loads the model (and applies
+    keep_alive); failures are logged, never fatal.
+    """
+    started = time.perf_counter()
+    try:
+        response = await http_client.post(
+            "/api/generate", json={"model": OLLAMA_MODEL, "keep_alive": keep_alive()}
+        )
+        response.raise_for_status()
+        observe_stage("model_preload", time.perf_counter() - started, backend="ollama")
+    except httpx.HTTPError as e:
+        logger.warning("Preloading %s failed: %s", OLLAMA_MODEL, e)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global http_client
+    http_client = create_http_client()
+    if SANDBOX_ENABLED:
+        await sandbox_pool.start()
+    preload = asyncio.create_task(preload_model()) if OLLAMA_PRELOAD else None
+    try:
+        yield
+    finally:
+        if preload is not None:
+            preload.cancel()
+        await sandbox_pool.close()
+        generation_cache.flush()
+        await http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class PublicCORSMiddleware(CORSMiddleware):
+    """Wildcard CORS for the generation API, none for the sandbox.
+
+    Without CORS headers browsers refuse cross-origin preflights to
+    /sandbox/*, so a web page cannot drive code execution on localhost.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/sandbox"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
 
 app.add_middleware(
-    CORSMiddleware,
+    PublicCORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+
+def build_payload(prompt, language):
+    return {
+        "model": OLLAMA_MODEL,
+        "prompt": PROMPT_TEMPLATE.format(language=language, prompt=prompt),
+        "keep_alive": keep_alive(),
+    }
+
+
+def build_refine_payload(session, instruction):
+    """Only the new instruction travels when Ollama's context is available;
+    otherwise the previous script is quoted so the model still sees it."""
+    context = session.context_list()
+    if context is not None:
+        prompt = f"Update the {session.language} script above: {instruction}"
+    else:
+        prompt = (
+            f"Here is a {session.language} script:\n{session.last_result}\n\n"
+            f"Update it: {instruction}"
+        )
+    payload = {"model": session.model, "prompt": prompt, "keep_alive": keep_alive()}
+    if context is not None:
+        payload["context"] = context
+    return payload
+
+
+async def stream_ollama(payload, trace=None):
+    """Yield decoded NDJSON chunks from Ollama as soon as they arrive.
+
+    Closing the generator early closes the upstream HTTP response, which makes
+    Ollama abort the generation instead of finishing it for nobody. Connect
+    time, time to first token, JSON decode time and Ollama's own
+    prompt_eval/eval timings are added to `trace`; the whole upstream call is
+    its "upstream" stage (and span).
+    """
+    owned = trace is None
+    trace = trace or RequestTrace("ollama", "")
+    decode = 0.0
+    outcome = "error"
+    upstream = trace.start_stage("upstream")
+    connecting = trace.start_stage("connect")
+    try:
+        async with http_client.stream("POST", "/api/generate", json=payload) as response:
+            connecting.end()
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                decoding = time.perf_counter()
+                data = loads(line)
+                decode += time.perf_counter() - decoding
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                if data.get("response"):
+                    trace.first_token()
+                if data.get("done"):
+                    trace.ollama_stats(data)
+                    outcome = "ok"
+                yield data
+    finally:
+        connecting.end(record=False)  # no-op unless the connection failed
+        upstream.end()
+        trace.add("json_decode", decode)
+        if owned:
+            trace.finish(outcome)
+
+
+async def generate_text(payload, trace=None):
+    """Returns (text, context) where context is Ollama's token array for the turn."""
+    parts = []
+    context = None
+    async with aclosing(stream_ollama(payload, trace)) as chunks:
+        async for data in chunks:
+            parts.append(data.get("response", ""))
+            if data.get("done"):
+                context = data.get("context")
+    return "".join(parts).strip(), context
+
+
+def read_request(body):
+    return body.get("prompt", ""), body.get("language", "python"), bool(body.get("no_cache", False))
+
+
+def client_identity(request, body):
+    """(client_id, priority) used by the scheduler for fairness."""
+    client_id = (
+        request.headers.get("x-client-id")
+        or body.get("client_id")
+        or (request.client.host if request.client else "anonymous")
+    )
+    try:
+        priority = int(body.get("priority", 0))
+    except (TypeError, ValueError):
+        priority = 0
+    return client_id, priority
+
+
+def too_busy(retry_after):
+    return JSONResponse(
+        {"ok": False, "error": "Server busy, please retry later.", "retry_after": retry_after},
+        status_code=429,
+        headers={"Retry-After": str(int(retry_after))},
+    )
+
+
+def cache_key(prompt, language):
+    return make_key(prompt, language, OLLAMA_MODEL, PROMPT_TEMPLATE)
+
+
+async def generate_cached(prompt, language, client_id="anonymous", priority=0, no_cache=False):
+    """Cache lookup, then a scheduled (and coalesced) generation.
+
+    Returns (result, served from cache, Ollama context or None). Raises
+    QueueFull when the scheduler is saturated.
+    """
+    trace = RequestTrace("ollama", language)
+    key = cache_key(prompt, language)
+    if not no_cache:
+        with trace.stage("cache_lookup"):
+            # SQLite work stays off the event loop.
+            cached = await asyncio.to_thread(generation_cache.get, key)
+        if cached is not None:
+            trace.finish("cached")
+            return cached, True, None
+
+    payload = build_payload(prompt, language)
+    queued = trace.start_stage("queue_wait")
+
+    async def generate():
+        queued.end()
+        result, context = await generate_text(payload, trace)
+        if result:
+            await asyncio.to_thread(generation_cache.set, key, result)
+        return result, context
+
+    try:
+        result, context = await scheduler.run_coalesced(key, generate, client_id, priority)
+    except QueueFull:
+        trace.finish("rejected")
+        raise
+    except Exception:
+        trace.finish("error")
+        raise
+    # A request coalesced onto another's call never ran `generate`; finish()
+    # closes its queue_wait span without recording it.
+    trace.finish("ok")
+    return result, False, context
+
+
+def runtime_samples():
+    cache = generation_cache.stats()
+    queue = scheduler.stats()
+    return (
+        sample("scheduler_in_flight", "Generations currently running upstream.", queue["in_flight"])
+        + sample("scheduler_queue_depth", "Requests waiting for a slot.", queue["queue_depth"])
+        + sample("scheduler_rejected_total", "Requests refused with 429.", queue["rejected"], "counter")
+        + sample("scheduler_coalesced_total", "Requests that joined an identical in-flight call.",
+                 queue["coalesced"], "counter")
+        + sample("generation_cache_hits_total", "Generation cache hits.", cache["hits"], "counter")
+        + sample("generation_cache_misses_total", "Generation cache misses.", cache["misses"], "counter")
+        + sample("sandbox_running", "Sandbox jobs currently running.", sandbox_pool.running)
+        + sample("sessions_active", "Conversation sessions held for /refine.", sessions.stats()["sessions"])
+    )
+
+
+REGISTRY.add_collector(runtime_samples)
+
+
 @app.get("/")
-def root():
-    return {"status": "ok", "message": "Ollama backend running successfully"}
+async def root():
+    """Liveness plus a quick Ollama reachability check."""
+    probing = time.perf_counter()
+    try:
+        response = await http_client.get("/api/tags", timeout=2)
+        reachable = response.status_code == 200
+    except httpx.HTTPError:
+        reachable = False
+    probe_seconds = time.perf_counter() - probing
+    observe_stage("health_probe", probe_seconds, backend="ollama")
+    queue = scheduler.stats()
+    return {
+        "status": "ok" if reachable else "degraded",
+        "message": "Ollama backend running successfully" if reachable else "Ollama is not reachable",
+        "ollama": {"url": OLLAMA_BASE_URL, "model": OLLAMA_MODEL, "reachable": reachable,
+                   "probe_ms": round(probe_seconds * 1000, 1)},
+        "uptime_seconds": round(time.time() - STARTED_AT),
+        "in_flight": queue["in_flight"],
+        "queue_depth": queue["queue_depth"],
+    }
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return generation_cache.stats()
+
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    return scheduler.stats()
 
 @app.post("/generate")
 async def generate_script(request: Request):
     body = await request.json()
-    prompt = body.get("prompt", "")
-    language = body.get("language", "python")
+    prompt, language, no_cache = read_request(body)
+    client_id, priority = client_identity(request, body)
+    try:
+        result, cached, context = await generate_cached(prompt, language, client_id, priority, no_cache)
+        session = sessions.create(language, OLLAMA_MODEL, result, context)
+        return {"ok": True, "result": result, "cached": cached, "session_id": session.id}
+    except QueueFull as e:
+        return too_busy(e.retry_after)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+async def stream_events(payload, language, trace, client_id, priority, on_done):
+    """NDJSON events for one scheduled, streamed generation.
+
+    Emits {"token", "done"} lines and a {"code_block"} line after each closing
+    fence. `await on_done(text, context)` runs once the generation completes and
+    returns extra fields for the final line. The slot is taken inside the
+    generator so a disconnect (which cancels it) always releases it again.
+    """
+    try:
+        with trace.stage("queue_wait"):
+            await scheduler.acquire(client_id, priority)
+    except QueueFull as e:
+        trace.finish("rejected")
+        yield json.dumps({"error": str(e), "retry_after": e.retry_after, "done": True}) + "\n"
+        return
+    started = time.monotonic()
+    outcome = "cancelled"
+    try:
+        blocks = []
+        parser = ScriptResponseParser(language, on_code_block=blocks.append)
+        async with aclosing(stream_ollama(payload, trace)) as chunks:
+            async for data in chunks:
+                token = data.get("response", "")
+                parser.feed_text(token)
+                line = {"token": token, "done": data.get("done", False)}
+                if line["done"]:
+                    parser.close()
+                    outcome = "ok"
+                    # Disconnects never get here, so only complete answers are kept.
+                    line.update(await on_done(parser.text.strip(), data.get("context")))
+                yield json.dumps(line) + "\n"
+                while blocks:
+                    yield json.dumps({"code_block": blocks.pop(0).as_dict()}) + "\n"
+    except Exception as e:
+        outcome = "error"
+        yield json.dumps({"error": str(e), "done": True}) + "\n"
+    finally:
+        trace.finish(outcome)
+        scheduler.record_service(time.monotonic() - started)
+        scheduler.release()
+
+
+@app.post("/generate/stream")
+async def generate_script_stream(request: Request):
+    """Forward tokens as NDJSON lines: {"token": ..., "done": ...}.
+
+    Each fenced code block is also emitted as {"code_block": {"language",
+    "code", "section"}} right after its closing fence arrives, so clients can
+    start checking or running the script before the answer is complete. The
+    final line carries the "session_id" to use with /refine.
+
+    Starlette cancels this generator when the client disconnects; the
+    cancellation propagates into stream_ollama and drops the upstream call.
+    """
+    body = await request.json()
+    prompt, language, no_cache = read_request(body)
+    client_id, priority = client_identity(request, body)
+    trace = RequestTrace("ollama", language)
+    key = cache_key(prompt, language)
+    cached = None
+    if not no_cache:
+        with trace.stage("cache_lookup"):
+            cached = await asyncio.to_thread(generation_cache.get, key)
+
+    if cached is not None:
+        trace.finish("cached")
+        session = sessions.create(language, OLLAMA_MODEL, cached, None)
 
-    payload = {
-        "model": "codellama:7b",
-        "prompt": f"Write a {language} script for this task: {prompt}",
+        async def replay():
+            line = {"token": cached, "done": True, "cached": True, "session_id": session.id}
+            yield json.dumps(line) + "\n"
+            for block in parse_script_response(cached, language).code_blocks:
+                yield json.dumps({"code_block": block.as_dict()}) + "\n"
+
+        return StreamingResponse(replay(), media_type="application/x-ndjson")
+
+    if scheduler.is_full():
+        trace.finish("rejected")
+        return too_busy(scheduler.retry_after())
+
+    async def on_done(result, context):
+        if result:
+            await asyncio.to_thread(generation_cache.set, key, result)
+        return {"session_id": sessions.create(language, OLLAMA_MODEL, result, context).id}
+
+    events = stream_events(build_payload(prompt, language), language, trace, client_id, priority, on_done)
+    return StreamingResponse(events, media_type="application/x-ndjson")
+
+@app.post("/refine")
+async def refine_script(request: Request):
+    """Apply a follow-up instruction to a previous generation.
+
+    Body: {"session_id", "instruction", "stream"?}. Only the instruction is
+    sent, together with the Ollama context kept for the session, so the model
+    does not re-process the earlier exchange. Refinements are not cached.
+    """
+    body = await request.json()
+    session = sessions.get(body.get("session_id", ""))
+    if session is None:
+        return JSONResponse({"ok": False, "error": "Unknown or expired session."}, status_code=404)
+    instruction = body.get("instruction", "").strip()
+    if not instruction:
+        return JSONResponse({"ok": False, "error": "Missing 'instruction'."}, status_code=400)
+
+    client_id, priority = client_identity(request, body)
+    reused_context = session.context is not None
+    payload = build_refine_payload(session, instruction)
+    trace = RequestTrace("ollama", session.language)
+
+    if body.get("stream"):
+        if scheduler.is_full():
+            trace.finish("rejected")
+            return too_busy(scheduler.retry_after())
+
+        async def on_done(result, context):
+            sessions.update(session, result, context)
+            return {"session_id": session.id, "turns": session.turns, "reused_context": reused_context}
+
+        events = stream_events(payload, session.language, trace, client_id, priority, on_done)
+        return StreamingResponse(events, media_type="application/x-ndjson")
+
+    queued = trace.start_stage("queue_wait")
+
+    async def refine():
+        queued.end()
+        return await generate_text(payload, trace)
+
+    try:
+        result, context = await scheduler.run(refine, client_id, priority)
+    except QueueFull as e:
+        trace.finish("rejected")
+        return too_busy(e.retry_after)
+    except Exception as e:
+        trace.finish("error")
+        return {"ok": False, "error": str(e)}
+    trace.finish("ok")
+    sessions.update(session, result, context)
+    return {
+        "ok": True,
+        "result": result,
+        "session_id": session.id,
+        "turns": session.turns,
+        "reused_context": reused_context,
     }
 
+@app.get("/sessions/stats")
+def session_stats():
+    return sessions.stats()
+
+@app.get("/sessions/{session_id}")
+def session_info(session_id: str):
+    session = sessions.get(session_id)
+    if session is None:
+        return JSONResponse({"ok": False, "error": "Unknown or expired session."}, status_code=404)
+    return session.info()
+
+@app.delete("/sessions/{session_id}")
+def end_session(session_id: str):
+    return {"ok": sessions.delete(session_id)}
+
+@app.post("/generate/batch")
+async def generate_batch(request: Request, concurrency: int = 4, job_id: str = "", no_cache: bool = False):
+    """Generate every task of a JSONL upload and stream results back as JSONL.
+
+    Accepts a multipart upload (field "file") or a raw JSONL body of
+    {"prompt", "language", "id"?} lines. Results arrive in completion order
+    and keep their task id. With `job_id`, finished items are checkpointed;
+    repeating the request resumes the job and replays them with "resumed": true.
+    Batch work runs at a lower scheduler priority than interactive requests.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None:
+            return JSONResponse({"ok": False, "error": "Missing 'file' field."}, status_code=400)
+        data = await upload.read()
+    else:
+        data = await request.body()
+    tasks = list(read_tasks(data.splitlines()))
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    client_id = f"batch:{job_id or client_identity(request, {})[0]}"
+
+    async def generate(prompt, language):
+        result, cached, _ = await generate_cached(prompt, language, client_id, priority=10, no_cache=no_cache)
+        return result, cached
+
+    async def results():
+        checkpoint = Checkpoint(checkpoint_path(job_id)) if job_id else None
+        try:
+            jobs = run_batch(tasks, generate, concurrency, checkpoint, replay=True, fingerprint=cache_key)
+            async with aclosing(jobs) as batch:
+                async for result in batch:
+                    yield json.dumps(result) + "\n"
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/sandbox/stats")
+def sandbox_stats():
+    return sandbox_pool.stats()
+
+def sandbox_denied(request):
+    """An error response unless this request may run code, else None."""
+    if not SANDBOX_ENABLED:
+        return JSONResponse(
+            {"ok": False, "error": "The sandbox is disabled; set SANDBOX_ENABLED=1 to allow code execution."},
+            status_code=403,
+        )
+    # Browsers always send Origin on cross-origin POSTs, including the
+    # "simple" ones that skip the CORS preflight.
+    if request.headers.get("origin"):
+        return JSONResponse({"ok": False, "error": "Browser requests cannot use the sandbox."}, status_code=403)
+    if SANDBOX_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied.encode(), SANDBOX_TOKEN.encode()):
+            return JSONResponse({"ok": False, "error": "Invalid sandbox token."}, status_code=401)
+    return None
+
+@app.post("/sandbox/run")
+async def sandbox_run(request: Request):
+    """Run a script in a warm sandbox worker.
+
+    Body: {"language", "code", "timeout"?, "stream"?}. With "stream": true the
+    response is NDJSON {"stream", "data"} chunks followed by a final
+    {"returncode", "timed_out", "truncated", "duration"} line. Disabled unless
+    SANDBOX_ENABLED is set; see sandbox_denied().
+    """
+    denied = sandbox_denied(request)
+    if denied is not None:
+        return denied
+    body = await request.json()
+    language = body.get("language", "python")
+    code = body.get("code", "")
+    try:
+        timeout = min(float(body.get("timeout", SANDBOX_TIMEOUT)), SANDBOX_TIMEOUT)
+    except (TypeError, ValueError):
+        timeout = SANDBOX_TIMEOUT
+
+    if not sandbox_pool.supports(language):
+        return JSONResponse(
+            {"ok": False, "error": f"Unsupported language '{language}'.", "supported": sandbox_pool.languages()},
+            status_code=400,
+        )
+
+    if body.get("stream"):
+        async def events():
+            async with aclosing(sandbox_pool.run(language, code, timeout)) as run:
+                async for event in run:
+                    yield json.dumps(event) + "\n"
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
     try:
-        response = requests.post("http://127.0.0.1:11434/api/generate", json=payload, stream=True)
-        result = ""
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode("utf-8"))
-                result += data.get("response", "")
-        return {"ok": True, "result": result.strip()}
+        result = await sandbox_pool.run_collect(language, code, timeout)
+        return {"ok": True, **result}
     except Exception as e:
-        return {"ok": False, "error": str(e)}
\ No newline at end of file
+        return {"ok": False, "error": str(e)}
@@ -1,13 +1,374 @@
-import tempfile
-import subprocess
+import asyncio
+import codecs
 import os
-import shlex
-import pathlib
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, rely on the timeout only
+    resource = None
 
 # WARNING: This is a *minimal* sandbox. For production use, run inside a Docker container
 # with resource limits and NO network access. The local sandbox below creates a tempdir,
 # writes the script, and invokes it with a timeout.
 
+# ---------------- CONFIG ----------------
+# /sandbox/run executes arbitrary code, so it is off unless explicitly enabled.
+SANDBOX_ENABLED = os.getenv("SANDBOX_ENABLED", "0").lower() in ("1", "true", "yes")
+# Optional shared secret; when set, callers must send `Authorization: Bearer <token>`.
+SANDBOX_TOKEN = os.getenv("SANDBOX_TOKEN", "")
+SANDBOX_MAX_CONCURRENT = int(os.getenv("SANDBOX_MAX_CONCURRENT", "4"))
+SANDBOX_WARM_WORKERS = int(os.getenv("SANDBOX_WARM_WORKERS", "2"))  # per language
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "10"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "10"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "512"))
+SANDBOX_FILE_SIZE_MB = int(os.getenv("SANDBOX_FILE_SIZE_MB", "16"))
+# Extra processes/threads a job may start, on top of what the user already runs
+SANDBOX_MAX_PROCESSES = int(os.getenv("SANDBOX_MAX_PROCESSES", "64"))
+SANDBOX_MAX_OUTPUT_BYTES = int(os.getenv("SANDBOX_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+# ----------------------------------------
+
+# Every runner is started ahead of time and blocks reading the program from
+# stdin, so interpreter startup is paid before a job arrives. The program is
+# saved into the worker's scratch directory before it runs.
+PYTHON_BOOTSTRAP = (
+    "import sys\n"
+    "src = sys.stdin.read()\n"
+    "open('script.py', 'w', encoding='utf-8').write(src)\n"
+    "sys.argv = ['script.py']\n"
+    "exec(compile(src, 'script.py', 'exec'), {'__name__': '__main__', '__file__': 'script.py'})\n"
+)
+NODE_BOOTSTRAP = (
+    "const fs = require('fs'), path = require('path'); let src = '';"
+    "process.stdin.setEncoding('utf8');"
+    "process.stdin.on('data', d => { src += d; }).on('end', () => {"
+    "  fs.writeFileSync('script.js', src); require(path.resolve('script.js')); });"
+)
+BASH_BOOTSTRAP = 'script=$(cat); printf "%s" "$script" > script.sh; eval "$script"'
+POWERSHELL_BOOTSTRAP = (
+    "$src = [Console]::In.ReadToEnd(); Set-Content -Path script.ps1 -Value $src; "
+    "Invoke-Expression $src"
+)
+
+LANGUAGE_ALIASES = {
+    "py": "python",
+    "sh": "bash",
+    "js": "node",
+    "javascript": "node",
+    "pwsh": "powershell",
+}
+
+
+class UnsupportedLanguage(Exception):
+    pass
+
+
+def normalize_language(language):
+    language = language.strip().lower()
+    return LANGUAGE_ALIASES.get(language, language)
+
+
+def runner_command(language):
+    """argv for a warm worker, or None when the interpreter is not installed.
+
+    Node and PowerShell reserve far more address space than they use, so they
+    get their heap capped by flags instead of RLIMIT_AS.
+    """
+    if language == "python":
+        return [sys.executable, "-I", "-u", "-c", PYTHON_BOOTSTRAP], True
+    if language == "bash":
+        bash = shutil.which("bash")
+        return ([bash, "-c", BASH_BOOTSTRAP], True) if bash else None
+    if language == "node":
+        node = shutil.which("node")
+        if node is None:
+            return None
+        return [node, f"--max-old-space-size={SANDBOX_MEMORY_MB}", "-e", NODE_BOOTSTRAP], False
+    if language == "powershell":
+        pwsh = shutil.which("pwsh") or shutil.which("powershell")
+        if pwsh is None:
+            return None
+        return [pwsh, "-NoProfile", "-NonInteractive", "-Command", POWERSHELL_BOOTSTRAP], False
+    return None
+
+
+def user_task_count():
+    """Processes plus threads owned by our real UID (Linux), or None if unknown."""
+    uid = str(os.getuid())
+    try:
+        pids = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue  # exited while we were looking
+        if fields.get("Uid", "").split()[:1] == [uid]:
+            total += int(fields.get("Threads", "1"))
+    return total
+
+
+def limit_resources(limit_memory):
+    """preexec_fn applying rlimits in the child before it execs."""
+    def apply():
+        mb = 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_CPU, (SANDBOX_CPU_SECONDS, SANDBOX_CPU_SECONDS))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (SANDBOX_FILE_SIZE_MB * mb, SANDBOX_FILE_SIZE_MB * mb))
+        if limit_memory:
+            resource.setrlimit(resource.RLIMIT_AS, (SANDBOX_MEMORY_MB * mb, SANDBOX_MEMORY_MB * mb))
+    return apply
+
+
+def limit_processes(pid):
+    """Cap a worker's RLIMIT_NPROC just before it receives its job.
+
+    RLIMIT_NPROC counts every process and thread of the UID, not just the
+    worker's children, so the cap is what the user runs right now plus
+    SANDBOX_MAX_PROCESSES. Setting it at spawn time instead would go stale
+    while the worker sits warm and the pool starts more workers. Skipped
+    where prlimit or /proc is unavailable.
+    """
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    in_use = user_task_count()
+    if in_use is None:
+        return
+    limit = in_use + SANDBOX_MAX_PROCESSES
+    try:
+        resource.prlimit(pid, resource.RLIMIT_NPROC, (limit, limit))
+    except (OSError, ValueError):
+        pass  # worker already gone; the job will fail on its own
+
+
+class Worker:
+    def __init__(self, language, process, scratch_dir):
+        self.language = language
+        self.process = process
+        self.scratch_dir = scratch_dir
+
+    @property
+    def alive(self):
+        return self.process.returncode is None
+
+    def kill(self):
+        if self.alive:
+            try:
+                # Workers lead their own session, so this also reaps children.
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError, AttributeError):
+                self.process.kill()
+
+    def cleanup(self):
+        self.kill()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+class SandboxPool:
+    """Pool of pre-started, resource-limited interpreters.
+
+    Each worker runs exactly one job in a fresh scratch directory and is then
+    discarded, so no state leaks between jobs; a replacement is started in the
+    background straight away to keep `warm_workers` spares per language.
+    """
+
+    def __init__(self, max_concurrent=SANDBOX_MAX_CONCURRENT, warm_workers=SANDBOX_WARM_WORKERS):
+        self.max_concurrent = max_concurrent
+        self.warm_workers = warm_workers
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._spares = {}  # language -> deque of Worker
+        self._tasks = set()
+        self._starting = {}  # language -> spares currently being spawned
+        self.running = 0
+        self.completed = 0
+
+    def languages(self):
+        return [lang for lang in ("python", "bash", "node", "powershell") if runner_command(lang)]
+
+    def supports(self, language):
+        return normalize_language(language) in self.languages()
+
+    async def start(self):
+        for language in self.languages():
+            for _ in range(self.warm_workers):
+                await self._add_spare(language)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        for spares in self._spares.values():
+            while spares:
+                spares.popleft().cleanup()
+
+    async def _spawn(self, language):
+        command = runner_command(language)
+        if command is None:
+            raise UnsupportedLanguage(f"No runner available for '{language}' on this host.")
+        argv, limit_memory = command
+        scratch_dir = tempfile.mkdtemp(prefix=f"sandbox-{language}-")
+        env = {
+            "PATH": os.environ.get("PATH", os.defpath),
+            "HOME": scratch_dir,
+            "TMPDIR": scratch_dir,
+            "LANG": "C.UTF-8",
+            "PYTHONIOENCODING": "utf-8",
+        }
+        kwargs = {}
+        if resource is not None:
+            kwargs["preexec_fn"] = limit_resources(limit_memory)
+            kwargs["start_new_session"] = True
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=scratch_dir,
+            env=env,
+            **kwargs,
+        )
+        return Worker(language, process, scratch_dir)
+
+    async def _add_spare(self, language):
+        worker = await self._spawn(language)
+        self._spares.setdefault(language, deque()).append(worker)
+
+    def _replenish(self, language):
+        warm = len(self._spares.get(language, ())) + self._starting.get(language, 0)
+        if warm >= self.warm_workers:
+            return
+        self._starting[language] = self._starting.get(language, 0) + 1
+
+        def done(task):
+            self._tasks.discard(task)
+            self._starting[language] -= 1
+
+        task = asyncio.create_task(self._add_spare(language))
+        self._tasks.add(task)
+        task.add_done_callback(done)
+
+    async def _checkout(self, language):
+        spares = self._spares.get(language)
+        while spares:
+            worker = spares.popleft()
+            if worker.alive:
+                self._replenish(language)
+                return worker
+            worker.cleanup()
+        worker = await self._spawn(language)
+        self._replenish(language)
+        return worker
+
+    async def run(self, language, code, timeout=SANDBOX_TIMEOUT):
+        """Run `code` and yield events as output arrives.
+
+        Yields {"stream": "stdout"|"stderr", "data": str} chunks, then a final
+        {"returncode", "timed_out", "truncated", "duration"} event. Closing the
+        generator early kills the worker.
+        """
+        language = normalize_language(language)
+        async with self._slots:
+            worker = await self._checkout(language)
+            await asyncio.to_thread(limit_processes, worker.process.pid)
+            self.running += 1
+            started = time.monotonic()
+            events = asyncio.Queue()
+            budget = {"bytes": SANDBOX_MAX_OUTPUT_BYTES, "truncated": False}
+
+            async def pump(name, stream):
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                while True:
+                    chunk = await stream.read(4096)
+                    if not chunk:
+                        break
+                    budget["bytes"] -= len(chunk)
+                    if budget["bytes"] < 0:
+                        budget["truncated"] = True
+                        worker.kill()
+                        break
+                    text = decoder.decode(chunk)
+                    if text:
+                        await events.put({"stream": name, "data": text})
+
+            async def feed():
+                try:
+                    worker.process.stdin.write(code.encode("utf-8"))
+                    await worker.process.stdin.drain()
+                    worker.process.stdin.close()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            async def supervise():
+                try:
+                    await feed()
+                    await asyncio.gather(
+                        pump("stdout", worker.process.stdout),
+                        pump("stderr", worker.process.stderr),
+                    )
+                    await worker.process.wait()
+                finally:
+                    await events.put(None)
+
+            supervisor = asyncio.create_task(supervise())
+            deadline = started + timeout
+            timed_out = False
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if timed_out:
+                            break  # output pipes still open after the kill; give up
+                        timed_out = True
+                        worker.kill()
+                        deadline = time.monotonic() + 5  # let the pumps drain
+                        continue
+                    try:
+                        event = await asyncio.wait_for(events.get(), remaining)
+                    except asyncio.TimeoutError:
+                        continue
+                    if event is None:
+                        break
+                    yield event
+                yield {
+                    "returncode": worker.process.returncode,
+                    "timed_out": timed_out,
+                    "truncated": budget["truncated"],
+                    "duration": round(time.monotonic() - started, 3),
+                }
+            finally:
+                worker.cleanup()
+                supervisor.cancel()
+                self.running -= 1
+                self.completed += 1
+
+    async def run_collect(self, language, code, timeout=SANDBOX_TIMEOUT):
+        """Non-streaming variant of run(): one dict with the whole output."""
+        stdout, stderr, result = [], [], {}
+        async for event in self.run(language, code, timeout):
+            if event.get("stream") == "stdout":
+                stdout.append(event["data"])
+            elif event.get("stream") == "stderr":
+                stderr.append(event["data"])
+            else:
+                result = event
+        return {**result, "stdout": "".join(stdout), "stderr": "".join(stderr)}
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "completed": self.completed,
+            "warm": {language: len(spares) for language, spares in self._spares.items()},
+        }
+
+
 def run_python_script(code: str, timeout: int = 10):
     with tempfile.TemporaryDirectory() as td:
         script_path = os.path.join(td, "script.py")
@@ -27,4 +388,4 @@ def run_powershell_script(code: str, timeout: int = 10):
         with open(script_path, "w", encoding="utf-8") as f:
             f.write(code)
         proc = subprocess.run([pwsh, "-File", script_path], capture_output=True, text=True, timeout=timeout)
-        return {"returncode": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr}
\ No newline at end of file
+        return {"returncode": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr}
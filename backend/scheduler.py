@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+
+# Admission control in front of Ollama. Requests wait in per-client queues and
+# are granted one of `max_in_flight` slots, best priority first and round-robin
+# across clients at the same priority, so a single chatty client cannot starve
+# everyone else. Identical concurrent requests share a single upstream call.
+
+SCHEDULER_MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", "2"))
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "32"))
+# Used for Retry-After until we have observed at least one completed job.
+SCHEDULER_DEFAULT_RETRY_AFTER = float(os.getenv("SCHEDULER_DEFAULT_RETRY_AFTER", "5"))
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Scheduler queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Scheduler:
+    def __init__(self, max_in_flight=SCHEDULER_MAX_IN_FLIGHT, max_queue=SCHEDULER_MAX_QUEUE):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._queues = OrderedDict()  # client_id -> deque of (priority, enqueued_at, future)
+        self._queued = 0
+        self._coalesced = {}  # key -> future shared by every waiter
+        self.admitted = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_service = 0.0
+        self.completed = 0
+
+    # ---- admission ----
+    def retry_after(self):
+        if not self.completed:
+            return SCHEDULER_DEFAULT_RETRY_AFTER
+        # Expected time for the queue ahead of a new request to drain.
+        avg_service = self.total_service / self.completed
+        return max(1, round(avg_service * (self._queued + 1) / self.max_in_flight))
+
+    def is_full(self):
+        return self._queued >= self.max_queue and self.in_flight >= self.max_in_flight
+
+    async def acquire(self, client_id="anonymous", priority=0):
+        """Wait for an in-flight slot. Lower `priority` values are served first."""
+        if self.in_flight < self.max_in_flight and not self._queued:
+            self.in_flight += 1
+            self.admitted += 1
+            self._record_wait(0.0)
+            return
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, time.monotonic(), future)
+        self._queues.setdefault(client_id, deque()).append(entry)
+        self._queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled; hand it on.
+                self.release()
+            else:
+                self._remove(client_id, entry)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _remove(self, client_id, entry):
+        queue = self._queues.get(client_id)
+        if queue is not None and entry in queue:
+            queue.remove(entry)
+            self._queued -= 1
+            if not queue:
+                del self._queues[client_id]
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight and self._queued:
+            # Best head-of-line priority wins; ties go to the client that has
+            # waited longest for a turn (OrderedDict order = round-robin).
+            client_id = min(self._queues, key=lambda c: self._queues[c][0][0])
+            queue = self._queues.pop(client_id)
+            _, enqueued_at, future = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues[client_id] = queue  # re-append: back of the rotation
+            if future.done():
+                continue
+            self.in_flight += 1
+            self.admitted += 1
+            self._record_wait(time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    def _record_wait(self, waited):
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    # ---- execution ----
+    async def run(self, factory, client_id="anonymous", priority=0):
+        """Run `await factory()` once a slot is free."""
+        await self.acquire(client_id, priority)
+        started = time.monotonic()
+        try:
+            return await factory()
+        finally:
+            self.record_service(time.monotonic() - started)
+            self.release()
+
+    def record_service(self, seconds):
+        self.total_service += seconds
+        self.completed += 1
+
+    async def run_coalesced(self, key, factory, client_id="anonymous", priority=0):
+        """Like run(), but concurrent calls with the same key share one result.
+
+        The shared call is not cancelled when an individual waiter goes away,
+        so the remaining waiters (and the cache) still get the result.
+        """
+        future = self._coalesced.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self.run(factory, client_id, priority))
+        self._coalesced[key] = future
+        future.add_done_callback(lambda _: self._coalesced.pop(key, None))
+        # Retrieve the exception even if every waiter has gone away.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self._queued,
+            "clients_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "avg_wait_seconds": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.max_wait,
+            "avg_service_seconds": self.total_service / self.completed if self.completed else 0.0,
+        }
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+
+# Conversation sessions for iterative refinement. Each session keeps the
+# `context` token array Ollama returned for its last turn, so a follow-up
+# like "now add logging" only has to send the new instruction instead of
+# re-processing the whole exchange. Contexts are stored as compact int32
+# arrays, and the store is bounded by session count, context length and idle
+# TTL (least recently used sessions go first).
+
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_CONTEXT_TOKENS = int(os.getenv("SESSION_MAX_CONTEXT_TOKENS", "8192"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+
+
+class Session:
+    def __init__(self, session_id, language, model):
+        self.id = session_id
+        self.language = language
+        self.model = model
+        self.context = None  # array("i") of token ids, or None
+        self.last_result = ""
+        self.turns = 0
+        self.created = time.time()
+        self.last_used = self.created
+
+    def update(self, result, context, max_tokens):
+        self.last_result = result
+        self.turns += 1
+        self.last_used = time.time()
+        if context and len(context) <= max_tokens:
+            self.context = array("i", context)
+        else:
+            # Too long to resend cheaply (or none returned): the next refine
+            # falls back to quoting last_result in the prompt.
+            self.context = None
+
+    def context_list(self):
+        return self.context.tolist() if self.context is not None else None
+
+    def info(self):
+        return {
+            "session_id": self.id,
+            "language": self.language,
+            "model": self.model,
+            "turns": self.turns,
+            "context_tokens": len(self.context) if self.context is not None else 0,
+            "idle_seconds": round(time.time() - self.last_used, 1),
+        }
+
+
+class SessionStore:
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS,
+                 max_context_tokens=SESSION_MAX_CONTEXT_TOKENS, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.max_context_tokens = max_context_tokens
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def create(self, language, model, result, context):
+        session = Session(uuid.uuid4().hex, language, model)
+        session.update(result, context, self.max_context_tokens)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict()
+        return session
+
+    def get(self, session_id):
+        """The live session, or None if unknown or idle for longer than the TTL.
+
+        A lookup counts as use: it refreshes `last_used` as well as the LRU
+        order, which `_evict` relies on staying sorted by `last_used`.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            now = time.time()
+            if self.ttl > 0 and now - session.last_used > self.ttl:
+                del self._sessions[session_id]
+                self.evicted += 1
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def update(self, session, result, context):
+        with self._lock:
+            session.update(result, context, self.max_context_tokens)
+            if session.id in self._sessions:
+                self._sessions.move_to_end(session.id)
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _evict(self):
+        now = time.time()
+        # Oldest-used first, so expired sessions sit at the front.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            expired = self.ttl > 0 and now - oldest.last_used > self.ttl
+            if not expired and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "context_tokens": sum(
+                    len(s.context) for s in self._sessions.values() if s.context is not None
+                ),
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,180 @@
+import json
+import re
+from dataclasses import asdict, dataclass, field
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib decoder works too
+    orjson = None
+
+# Incremental parser for the "1. Problem / 2. Tech Used /
+# 3. Libraries/Prerequisites / 4. Script Code" answers requested by the prompt
+# templates. Tokens are buffered as a list of chunks and only complete lines
+# are examined, so each character is scanned once no matter how the model
+# splits its output. Stdlib only (orjson if installed), so the frontend can
+# import it as `backend.stream_parser`.
+
+
+def loads(data):
+    """Decode one NDJSON line (bytes or str)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+SECTION_HEADING = re.compile(
+    r"^\s*(?P<prefix>(?:#{1,6}\s*)?(?:\*\*)?\s*(?:\d+\s*[.)])?)\s*(?:\*\*)?\s*"
+    r"(?P<name>problem|tech(?:nologies|nology)?(?:\s+used)?|libraries(?:\s*/\s*prerequisites)?|"
+    r"prerequisites|script\s+code|code)\b\s*(?:\*\*)?\s*(?P<colon>:)?\s*(?:\*\*)?\s*(?P<rest>.*)$",
+    re.IGNORECASE,
+)
+SECTION_FIELDS = {
+    "problem": "problem",
+    "tech": "tech",
+    "libraries": "prerequisites",
+    "prerequisites": "prerequisites",
+    "script": "code",
+    "code": "code",
+}
+FENCE = re.compile(r"^\s*(```|~~~)\s*([\w+#.-]*)")
+
+
+@dataclass
+class CodeBlock:
+    language: str
+    code: str
+    section: str
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class ParsedScript:
+    problem: str = ""
+    tech: str = ""
+    prerequisites: str = ""
+    code: str = ""
+    language: str = ""
+    text: str = ""
+    code_blocks: list = field(default_factory=list)
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class ScriptResponseParser:
+    """Feed it the model output piece by piece; read the structure at any time.
+
+    `on_code_block(block)` fires as soon as a fenced block's closing fence
+    arrives, so callers can syntax-check, offer a download or start a sandbox
+    run while the rest of the answer is still streaming.
+    """
+
+    def __init__(self, default_language="", on_code_block=None):
+        self.default_language = default_language.lower()
+        self.on_code_block = on_code_block
+        self.done = False
+        self._chunks = []  # every token, joined once for `text`
+        self._partial = []  # pieces of the current, unterminated line
+        self._section = None
+        self._sections = {"problem": [], "tech": [], "prerequisites": []}
+        self._fence = None  # (marker, language) while inside a fenced block
+        self._fence_lines = []
+        self.code_blocks = []
+
+    # ---- input ----
+    def feed_text(self, text):
+        self._chunks.append(text)
+        self._partial.append(text)
+        if "\n" not in text:
+            return
+        lines = "".join(self._partial).split("\n")
+        self._partial = [lines.pop()]
+        for line in lines:
+            self._process(line)
+
+    def close(self):
+        if self.done:
+            return
+        self.done = True
+        tail = "".join(self._partial)
+        self._partial = []
+        if tail:
+            self._process(tail)
+        if self._fence is not None:
+            self._finish_block()  # unterminated fence: keep what we have
+
+    # ---- line handling ----
+    def _process(self, line):
+        if self._fence is not None:
+            if line.strip().startswith(self._fence[0]):
+                self._finish_block()
+            else:
+                self._fence_lines.append(line)
+            return
+
+        fence = FENCE.match(line)
+        if fence:
+            self._fence = (fence.group(1), fence.group(2).lower())
+            self._fence_lines = []
+            return
+
+        heading = SECTION_HEADING.match(line)
+        # "1. Problem", "## Tech Used" and "Problem: ..." are headings;
+        # prose that merely starts with one of the words ("Code is ...") is not.
+        if heading and (heading["prefix"].strip() or heading["colon"] or not heading["rest"]):
+            key = heading["name"].split()[0].split("/")[0].lower()
+            self._section = SECTION_FIELDS.get(key, SECTION_FIELDS.get(key[:4]))
+            rest = heading["rest"].strip().strip("*").strip()
+            if rest and self._section != "code":
+                self._sections[self._section].append(rest)
+            return
+
+        if self._section is not None and self._section != "code":
+            self._sections[self._section].append(line)
+
+    def _finish_block(self):
+        marker, language = self._fence
+        section = self._section or ""
+        block = CodeBlock(language or self.default_language, "\n".join(self._fence_lines), section)
+        self._fence = None
+        self._fence_lines = []
+        self.code_blocks.append(block)
+        if section and section != "code":
+            # e.g. a ```bash pip install``` block under prerequisites
+            self._sections[section].extend([marker + block.language, block.code, marker])
+        if self.on_code_block is not None:
+            self.on_code_block(block)
+
+    # ---- output ----
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def script_block(self):
+        """The block under "Script Code", else the first block seen."""
+        for block in self.code_blocks:
+            if block.section == "code":
+                return block
+        return self.code_blocks[0] if self.code_blocks else None
+
+    def result(self):
+        block = self.script_block()
+        return ParsedScript(
+            problem="\n".join(self._sections["problem"]).strip(),
+            tech="\n".join(self._sections["tech"]).strip(),
+            prerequisites="\n".join(self._sections["prerequisites"]).strip(),
+            code=block.code if block else "",
+            language=block.language if block else self.default_language,
+            text=self.text.strip(),
+            code_blocks=list(self.code_blocks),
+        )
+
+
+def parse_script_response(text, default_language=""):
+    """One-shot parse of an already complete answer (cache hits, HF)."""
+    parser = ScriptResponseParser(default_language)
+    parser.feed_text(text)
+    parser.close()
+    return parser.result()
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+from backend.batch import Checkpoint, read_tasks, run_batch
+from backend.cache import make_key
+
+# Unit tests for batch task parsing and checkpoint resume:
+#   python -m pytest backend/test_batch.py
+
+
+def fingerprinter(model):
+    return lambda prompt, language: make_key(prompt, language, model, "template")
+
+
+def run(lines, path=None, model="m1", concurrency=2, replay=True):
+    """Run a batch over JSONL `lines`; returns (results by id, prompts generated)."""
+    generated = []
+
+    async def generate(prompt, language):
+        generated.append(prompt)
+        return f"{prompt}@{model}", False
+
+    async def scenario():
+        checkpoint = Checkpoint(path) if path is not None else None
+        try:
+            batch = run_batch(read_tasks(lines), generate, concurrency, checkpoint, replay,
+                              fingerprint=fingerprinter(model))
+            return [result async for result in batch]
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+    results = asyncio.run(scenario())
+    return {str(result["id"]): result for result in results}, sorted(generated)
+
+
+def test_ids_default_to_line_numbers():
+    tasks = list(read_tasks(['{"prompt": "a"}', "", b'{"prompt": "b", "id": "x", "language": "bash"}']))
+    assert [(task["id"], task["language"]) for task in tasks] == [(1, "python"), ("x", "bash")]
+
+
+def test_malformed_lines_become_error_rows():
+    lines = [
+        "not json",
+        "[1, 2]",
+        '{"language": "python"}',
+        '{"prompt": 5}',
+        '{"prompt": "a", "language": null}',
+        '{"prompt": "a", "id": null}',
+        '{"prompt": "ok"}',
+    ]
+    results, generated = run(lines, concurrency=1)
+    assert generated == ["ok"]
+    assert results["7"]["ok"]
+    errors = {task_id: result["error"] for task_id, result in results.items() if not result["ok"]}
+    assert sorted(errors) == ["1", "2", "3", "4", "5", "6"]
+    assert errors["1"].startswith("invalid JSON")
+    assert "language" in errors["5"]
+    assert "id" in errors["6"]
+
+
+def test_duplicate_ids_are_rejected():
+    lines = ['{"id": 1, "prompt": "first"}', '{"id": "1", "prompt": "again"}', '{"prompt": "third"}']
+    tasks = list(read_tasks(lines))
+    assert tasks[1] == {"id": "1", "error": "duplicate id '1' on line 2"}
+    _, generated = run(lines)
+    assert generated == ["first", "third"]
+
+
+def test_resume_skips_only_unchanged_tasks(tmp_path):
+    path = tmp_path / "results.jsonl"
+    lines = ['{"prompt": "p1"}', '{"prompt": "p2"}']
+    _, generated = run(lines, path)
+    assert generated == ["p1", "p2"]
+
+    # Same inputs: everything is replayed from the checkpoint.
+    results, generated = run(lines, path)
+    assert generated == []
+    assert all(result["resumed"] for result in results.values())
+    assert results["2"]["result"] == "p2@m1"
+
+    # An inserted line shifts the default ids; no task may resume another's result.
+    results, generated = run(['{"prompt": "new"}'] + lines, path)
+    assert generated == ["new", "p1", "p2"]
+    assert results["3"]["result"] == "p2@m1"
+
+    # A different model changes every fingerprint.
+    results, generated = run(lines, path, model="m2")
+    assert generated == ["p1", "p2"]
+    assert results["1"]["result"] == "p1@m2"
+
+
+def test_without_replay_resumed_tasks_are_skipped(tmp_path):
+    path = tmp_path / "results.jsonl"
+    run(['{"prompt": "p1"}'], path)
+    results, generated = run(['{"prompt": "p1"}', '{"prompt": "p2"}'], path, replay=False)
+    assert generated == ["p2"]
+    assert list(results) == ["2"]
+
+
+def test_checkpoint_keeps_latest_success_and_ignores_torn_lines(tmp_path):
+    path = tmp_path / "results.jsonl"
+    rows = [
+        {"id": 1, "ok": True, "result": "old", "fingerprint": "a"},
+        {"id": 1, "ok": True, "result": "new", "fingerprint": "b"},
+        {"id": 2, "ok": False, "error": "boom"},
+    ]
+    path.write_text("\n".join(json.dumps(row) for row in rows) + '\n{"id": 3, "ok": tr')
+    checkpoint = Checkpoint(path)
+    checkpoint.record({"id": 4, "ok": True, "result": "appended", "fingerprint": "c"})
+    checkpoint.close()
+    reopened = Checkpoint(path)
+    reopened.close()
+    assert reopened.completed["4"]["result"] == "appended"
+    assert list(checkpoint.completed) == ["1", "4"]
+    assert checkpoint.completed["1"]["result"] == "new"
+    assert checkpoint.done(1, "b") and not checkpoint.done(1, "a")
+    assert not checkpoint.done(2, None)
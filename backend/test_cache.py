@@ -0,0 +1,87 @@
+import time
+
+from backend.cache import GenerationCache, make_key
+
+# Unit tests for the two-tier generation cache:
+#   python -m pytest backend/test_cache.py
+
+
+def test_key_depends_on_template_not_spacing_or_case():
+    key = make_key("rename  files\n", "Python", "codellama:7b", "Write a {language} script: {prompt}")
+    assert key == make_key("rename files", "python", "CodeLlama:7b", "Write a {language} script: {prompt}")
+    assert key != make_key("rename files", "python", "codellama:7b", "Generate a {language} script: {prompt}")
+
+
+def test_disk_tier_survives_restart_and_promotes_to_memory(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    GenerationCache(path).set("k", "v")
+
+    cache = GenerationCache(path)
+    assert cache.get("k") == "v"
+    assert cache.get("k") == "v"
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["memory_entries"]) == (1, 1, 1)
+
+
+def test_memory_only_when_path_is_empty():
+    cache = GenerationCache(path="", memory_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.set("c", "3")
+    assert cache.get("a") is None  # LRU evicted, and there is no disk tier
+    assert cache.get("c") == "3"
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_expires_both_tiers(tmp_path, monkeypatch):
+    path = tmp_path / "cache.sqlite3"
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = GenerationCache(path, ttl=60)
+    cache.set("k", "v")
+    now[0] += 30
+    assert cache.get("k") == "v"
+    now[0] += 31
+    assert cache.get("k") is None
+    assert GenerationCache(path, ttl=60).get("k") is None
+
+
+def test_disk_size_eviction_keeps_entries_hot_in_memory(tmp_path, monkeypatch):
+    path = tmp_path / "cache.sqlite3"
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = GenerationCache(path, memory_entries=10, disk_entries=3)
+    cache.set("hot", "resubmitted all day")
+    for i in range(3):
+        now[0] += 1
+        assert cache.get("hot") is not None  # served from memory every time
+        now[0] += 1
+        cache.set(f"new{i}", str(i))
+
+    restarted = GenerationCache(path, disk_entries=3)
+    assert restarted.get("hot") == "resubmitted all day"
+    # The least recently used entry went instead.
+    assert restarted.get("new0") is None
+    assert restarted.get("new2") == "2"
+
+
+def test_flush_persists_pending_hits(tmp_path, monkeypatch):
+    path = tmp_path / "cache.sqlite3"
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = GenerationCache(path)
+    cache.set("k", "v")
+    now[0] += 5
+    cache.get("k")
+    cache.flush()
+    (accessed,) = cache._db.execute("SELECT accessed FROM generations WHERE key = 'k'").fetchone()
+    assert accessed == 1005.0
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = GenerationCache(path)
+    cache.set("k", "v")
+    cache.clear()
+    assert cache.get("k") is None
+    assert GenerationCache(path).get("k") is None
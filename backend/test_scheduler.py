@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from backend.scheduler import QueueFull, Scheduler
+
+# Unit tests for the admission scheduler. Plain asyncio.run(), so no pytest
+# plugins are needed:  python -m pytest backend/test_scheduler.py
+
+
+async def settle():
+    # Let woken waiters run up to their next await.
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_priority_then_round_robin():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, max_queue=10)
+        await scheduler.acquire("holder")
+        order = []
+
+        async def wait(client_id, priority, label):
+            await scheduler.acquire(client_id, priority)
+            order.append(label)
+            scheduler.release()
+
+        waiters = [
+            asyncio.create_task(wait("a", 0, "a1")),
+            asyncio.create_task(wait("a", 0, "a2")),
+            asyncio.create_task(wait("a", 0, "a3")),
+            asyncio.create_task(wait("b", 0, "b1")),
+            asyncio.create_task(wait("c", 5, "c1")),
+            asyncio.create_task(wait("urgent", -1, "u1")),
+        ]
+        await settle()
+        assert scheduler.stats()["queue_depth"] == 6
+        scheduler.release()
+        await asyncio.gather(*waiters)
+        return order, scheduler
+
+    order, scheduler = asyncio.run(scenario())
+    # Lowest priority value first; client "a" cannot starve "b"; "c" goes last.
+    assert order == ["u1", "a1", "b1", "a2", "a3", "c1"]
+    assert scheduler.in_flight == 0
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, max_queue=1)
+        await scheduler.acquire("a")
+        waiter = asyncio.create_task(scheduler.acquire("b"))
+        await settle()
+        assert scheduler.is_full()
+        with pytest.raises(QueueFull) as excinfo:
+            await scheduler.acquire("c")
+        scheduler.release()
+        await waiter
+        scheduler.release()
+        return scheduler, excinfo.value
+
+    scheduler, error = asyncio.run(scenario())
+    assert error.retry_after > 0
+    assert scheduler.rejected == 1
+    assert scheduler.in_flight == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, max_queue=5)
+        await scheduler.acquire("a")
+        cancelled = asyncio.create_task(scheduler.acquire("b"))
+        survivor = asyncio.create_task(scheduler.acquire("c"))
+        await settle()
+        cancelled.cancel()
+        await settle()
+        assert scheduler.stats()["queue_depth"] == 1
+        scheduler.release()
+        await survivor
+        assert scheduler.in_flight == 1
+        scheduler.release()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.in_flight == 0
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, max_queue=5)
+        await scheduler.acquire("a")
+        unlucky = asyncio.create_task(scheduler.acquire("b"))
+        next_in_line = asyncio.create_task(scheduler.acquire("c"))
+        await settle()
+        # Grant b's slot and cancel b before it gets to run.
+        scheduler.release()
+        unlucky.cancel()
+        await settle()
+        assert unlucky.cancelled()
+        await next_in_line
+        assert scheduler.in_flight == 1
+        scheduler.release()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.in_flight == 0
+
+
+def test_run_releases_the_slot_on_error():
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, max_queue=1)
+        with pytest.raises(RuntimeError):
+            await scheduler.run(fail)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.in_flight == 0
+    assert scheduler.completed == 1
+
+
+def test_coalesces_identical_requests():
+    calls = []
+
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=2, max_queue=5)
+        release = asyncio.Event()
+
+        async def generate():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        waiters = [asyncio.create_task(scheduler.run_coalesced("key", generate)) for _ in range(3)]
+        await settle()
+        # Cancelling one waiter must not cancel the shared call.
+        waiters[0].cancel()
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return scheduler, results
+
+    scheduler, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == ["result", "result"]
+    assert scheduler.coalesced == 2
+    assert scheduler.in_flight == 0
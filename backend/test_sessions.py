@@ -0,0 +1,65 @@
+import time
+
+from backend.sessions import SessionStore
+
+# Unit tests for the refinement session store:
+#   python -m pytest backend/test_sessions.py
+
+
+def fake_clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_idle_sessions_expire(monkeypatch):
+    now = fake_clock(monkeypatch)
+    store = SessionStore(ttl=60)
+    session = store.create("python", "m", "v1", [1, 2, 3])
+    now[0] += 50
+    assert store.get(session.id) is session
+    now[0] += 50  # idle for 50s since the lookup above
+    assert store.get(session.id) is session
+    now[0] += 61
+    assert store.get(session.id) is None
+    assert store.stats()["evicted"] == 1
+
+
+def test_expired_session_is_evicted_behind_a_recently_read_one(monkeypatch):
+    now = fake_clock(monkeypatch)
+    store = SessionStore(ttl=60)
+    stale = store.create("python", "m", "old", None)
+    now[0] += 30
+    live = store.create("python", "m", "new", None)
+    now[0] += 20
+    store.get(stale.id)  # moves "stale" to the back and refreshes it
+    now[0] += 50
+    # "live" is now idle for 70s and at the front, so creating a session evicts it.
+    store.create("bash", "m", "third", None)
+    assert store.get(live.id) is None
+    assert store.get(stale.id) is stale
+    assert store.stats()["sessions"] == 2
+
+
+def test_least_recently_used_session_goes_first(monkeypatch):
+    now = fake_clock(monkeypatch)
+    store = SessionStore(max_sessions=2, ttl=0)
+    a = store.create("python", "m", "a", None)
+    now[0] += 1
+    b = store.create("python", "m", "b", None)
+    now[0] += 1
+    store.get(a.id)
+    now[0] += 1
+    c = store.create("python", "m", "c", None)
+    assert store.get(b.id) is None
+    assert store.get(a.id) is a and store.get(c.id) is c
+    assert store.stats() == {"sessions": 2, "max_sessions": 2, "context_tokens": 0, "evicted": 1}
+
+
+def test_long_contexts_are_not_kept():
+    store = SessionStore(max_context_tokens=3)
+    session = store.create("python", "m", "v1", [1, 2, 3])
+    assert session.context_list() == [1, 2, 3]
+    store.update(session, "v2", [1, 2, 3, 4])
+    assert session.context is None and session.turns == 2
+    assert store.stats()["context_tokens"] == 0
@@ -0,0 +1,96 @@
+from backend.stream_parser import ScriptResponseParser, parse_script_response
+
+# Unit tests for the incremental response parser:
+#   python -m pytest backend/test_stream_parser.py
+
+ANSWER = """### 1. Problem
+Rename every file in a folder.
+
+**2. Tech Used:** Python 3
+
+3) Libraries/Prerequisites
+```bash
+pip install rich
+```
+
+## 4. Script Code
+```python
+import pathlib
+
+for path in pathlib.Path(".").iterdir():
+    print(path)
+```
+Code is printed above.
+"""
+
+SCRIPT = 'import pathlib\n\nfor path in pathlib.Path(".").iterdir():\n    print(path)'
+
+
+def feed(text, size):
+    """Parse `text` delivered in `size`-character tokens."""
+    blocks = []
+    parser = ScriptResponseParser("python", on_code_block=blocks.append)
+    for i in range(0, len(text), size):
+        parser.feed_text(text[i:i + size])
+    parser.close()
+    return parser, blocks
+
+
+def test_headings_split_sections():
+    parsed = parse_script_response(ANSWER, "python")
+    assert parsed.problem == "Rename every file in a folder."
+    assert parsed.tech == "Python 3"
+    assert parsed.prerequisites == "```bash\npip install rich\n```"
+    assert parsed.code == SCRIPT
+    assert parsed.language == "python"
+
+
+def test_prose_starting_with_a_section_word_is_not_a_heading():
+    parsed = parse_script_response("Problem: slow builds\nCode is fast\nTech: make\n")
+    assert parsed.problem == "slow builds\nCode is fast"
+    assert parsed.tech == "make"
+
+
+def test_token_boundaries_do_not_change_the_result():
+    expected = parse_script_response(ANSWER, "python")
+    for size in (1, 2, 3, 7, 64):
+        parser, _ = feed(ANSWER, size)
+        assert parser.result() == expected, size
+
+
+def test_fence_split_across_tokens_fires_callback_on_close():
+    tokens = ["Script Code:\n`", "``py", "thon\nprint(1)\n`", "`", "`\nafter\n"]
+    blocks = []
+    parser = ScriptResponseParser("bash", on_code_block=blocks.append)
+    parser.feed_text(tokens[0])
+    parser.feed_text(tokens[1])
+    parser.feed_text(tokens[2])
+    assert blocks == []
+    parser.feed_text(tokens[3])
+    parser.feed_text(tokens[4])
+    # The block is reported as soon as its closing fence line is complete.
+    assert [(b.language, b.code, b.section) for b in blocks] == [("python", "print(1)", "code")]
+    parser.close()
+    assert parser.text == "".join(tokens)
+
+
+def test_unterminated_fence_is_kept_on_close():
+    parser, blocks = feed("4. Script Code\n```\necho hi\necho bye", 5)
+    assert len(blocks) == 1
+    assert blocks[0].code == "echo hi\necho bye"
+    assert blocks[0].language == "python"  # no fence language: the default
+    assert parser.result().code == "echo hi\necho bye"
+
+
+def test_script_block_prefers_the_script_code_section():
+    text = "Prerequisites\n```bash\npip install x\n```\nCode:\n```python\nprint(2)\n```\n"
+    parsed = parse_script_response(text)
+    assert [block.section for block in parsed.code_blocks] == ["prerequisites", "code"]
+    assert parsed.code == "print(2)"
+    assert parsed.language == "python"
+
+
+def test_answer_without_sections():
+    parsed = parse_script_response("Just some text.", "bash")
+    assert (parsed.problem, parsed.code, parsed.language) == ("", "", "bash")
+    assert parsed.text == "Just some text."
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-in for Ollama (/api/tags, streaming /api/generate) and the
+# Hugging Face inference endpoint (POST /models/<model>). Timing and failures
+# are configurable and drawn from a seeded RNG, so two runs with the same
+# settings see the same sequence of errors and stalls.
+#
+#   python bench/fake_model_server.py --port 11434 --token-rate 40 --first-token-delay 0.5
+
+ANSWER = """### 1. Problem
+Rename every file in a folder so its name starts with today's date.
+
+### 2. Tech Used
+Python 3 standard library.
+
+### 3. Libraries/Prerequisites
+No third-party packages are required.
+
+### 4. Script Code
+```python
+import datetime
+import pathlib
+
+prefix = datetime.date.today().isoformat()
+for path in pathlib.Path(".").iterdir():
+    if path.is_file() and not path.name.startswith(prefix):
+        path.rename(path.with_name(f"{prefix}_{path.name}"))
+```
+"""
+
+
+@dataclass
+class StubConfig:
+    tokens: int = 200  # tokens per answer
+    token_rate: float = 50.0  # tokens per second once generation starts
+    first_token_delay: float = 0.2  # seconds of "prompt processing"
+    error_rate: float = 0.0  # share of requests answered with HTTP 500
+    stall_rate: float = 0.0  # per-token chance of stalling
+    stall_seconds: float = 2.0
+    seed: int = 0
+    model: str = "codellama:7b"
+
+
+def answer_tokens(count):
+    """`count` ~4-character tokens, repeating the canned answer as needed."""
+    pieces = [ANSWER[i:i + 4] for i in range(0, len(ANSWER), 4)]
+    return list(itertools.islice(itertools.cycle(pieces), count))
+
+
+def create_app(config=None):
+    config = config or StubConfig()
+    app = FastAPI()
+    app.state.config = config
+    counter = itertools.count()
+
+    def request_rng():
+        # One RNG per request, seeded by arrival order: deterministic for a
+        # given seed and request sequence, independent of token timing.
+        return random.Random(f"{config.seed}:{next(counter)}")
+
+    @app.get("/api/tags")
+    def tags():
+        return {"models": [{"name": config.model}]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        rng = request_rng()
+        if rng.random() < config.error_rate:
+            return JSONResponse({"error": "stub: injected failure"}, status_code=500)
+        model = body.get("model", config.model)
+        if "prompt" not in body:
+            # Ollama treats a prompt-less request as "load the model" (preload).
+            return {"model": model, "response": "", "done": True, "done_reason": "load"}
+        tokens = answer_tokens(config.tokens)
+
+        async def stream():
+            started = time.perf_counter_ns()
+            await asyncio.sleep(config.first_token_delay)
+            prompt_done = time.perf_counter_ns()
+            for token in tokens:
+                if config.stall_rate and rng.random() < config.stall_rate:
+                    await asyncio.sleep(config.stall_seconds)
+                await asyncio.sleep(1 / config.token_rate)
+                yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+            finished = time.perf_counter_ns()
+            yield json.dumps({
+                "model": model,
+                "response": "",
+                "done": True,
+                "context": list(range(len(tokens))),
+                "total_duration": finished - started,
+                "prompt_eval_count": len(body.get("prompt", "").split()),
+                "prompt_eval_duration": prompt_done - started,
+                "eval_count": len(tokens),
+                "eval_duration": finished - prompt_done,
+            }) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/models/{model:path}")
+    async def hf_inference(model: str, request: Request):
+        await request.body()
+        rng = request_rng()
+        if rng.random() < config.error_rate:
+            return JSONResponse({"error": "stub: injected failure"}, status_code=500)
+        delay = config.first_token_delay + config.tokens / config.token_rate
+        if config.stall_rate and rng.random() < config.stall_rate:
+            delay += config.stall_seconds
+        await asyncio.sleep(delay)
+        return [{"generated_text": "".join(answer_tokens(config.tokens))}]
+
+    return app
+
+
+def add_stub_arguments(parser):
+    defaults = StubConfig()
+    parser.add_argument("--tokens", type=int, default=defaults.tokens)
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate)
+    parser.add_argument("--first-token-delay", type=float, default=defaults.first_token_delay)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--stall-rate", type=float, default=defaults.stall_rate)
+    parser.add_argument("--stall-seconds", type=float, default=defaults.stall_seconds)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def stub_command_line(config, port, host="127.0.0.1"):
+    """argv that runs this server standalone with `config`."""
+    argv = [sys.executable, str(Path(__file__).resolve()), "--host", host, "--port", str(port)]
+    for name, value in asdict(config).items():
+        if name != "model":
+            argv += ["--" + name.replace("_", "-"), str(value)]
+    return argv
+
+
+def stub_config_from_args(args):
+    return StubConfig(
+        tokens=args.tokens,
+        token_rate=args.token_rate,
+        first_token_delay=args.first_token_delay,
+        error_rate=args.error_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama / HF server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    config = stub_config_from_args(args)
+    print("Stub config:", json.dumps(asdict(config)))
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
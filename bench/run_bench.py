@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import httpx
+import uvicorn
+
+from fake_model_server import add_stub_arguments, stub_command_line, stub_config_from_args
+
+# Load test for the FastAPI backend and the Streamlit generation helpers,
+# run against the local fake model server so results only reflect our code.
+# The stub runs in its own process; `rss_mb` is this process (backend,
+# frontend helpers and the driver) and `stub_rss_mb` the stub's.
+#
+#   python bench/run_bench.py --levels 1,4,16 --rounds 3 --compare bench/results/<previous>.json
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+TARGETS = ("backend", "frontend_ollama", "frontend_hf")
+ERROR_MARKERS = ("❌", "⚠️")
+
+
+# ---- measurement helpers ----
+def percentile(values, pct):
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def distribution(seconds):
+    ms = [s * 1000 for s in seconds]
+    return {
+        "mean": round(sum(ms) / len(ms), 2) if ms else None,
+        "p50": round(percentile(ms, 50), 2) if ms else None,
+        "p95": round(percentile(ms, 95), 2) if ms else None,
+        "p99": round(percentile(ms, 99), 2) if ms else None,
+    }
+
+
+def rss_mb(pid="self"):
+    """Current resident set size (Linux), else our own peak from getrusage."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None or pid != "self":
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(level, samples, wall, stub_pid=None):
+    ok = [s for s in samples if s["ok"]]
+    return {
+        "concurrency": level,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else None,
+        "ttft_ms": distribution([s["ttft"] for s in ok if s["ttft"] is not None]),
+        "latency_ms": distribution([s["latency"] for s in ok]),
+        "rss_mb": rss_mb(),
+        "stub_rss_mb": rss_mb(stub_pid) if stub_pid else None,
+    }
+
+
+# ---- servers ----
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(config, port):
+    """Run the fake model server as a separate process; returns the Popen."""
+    process = subprocess.Popen(stub_command_line(config, port))
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/tags", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f"stub server on port {port} did not start")
+            time.sleep(0.05)
+
+
+def serve(app, port):
+    """Run `app` with uvicorn on a daemon thread; returns the Server."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 15
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"server on port {port} did not start")
+        time.sleep(0.02)
+    return server
+
+
+# ---- drivers ----
+async def backend_level(base_url, level, total):
+    """`total` /generate/stream calls, at most `level` at a time."""
+    slots = asyncio.Semaphore(level)
+    limits = httpx.Limits(max_connections=level, max_keepalive_connections=level)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def one(i):
+            async with slots:
+                # Unique prompts and no_cache: measure generation, not the cache.
+                body = {"prompt": f"bench task {i}", "language": "python", "no_cache": True}
+                started = time.perf_counter()
+                ttft, ok = None, False
+                async with client.stream("POST", "/generate/stream", json=body) as response:
+                    if response.status_code == 200:
+                        ok = True
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            data = json.loads(line)
+                            if "error" in data:
+                                ok = False
+                            elif ttft is None and data.get("token"):
+                                ttft = time.perf_counter() - started
+                    else:
+                        await response.aread()
+                return {"ok": ok, "ttft": ttft, "latency": time.perf_counter() - started}
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*[one(i) for i in range(total)])
+        return list(samples), time.perf_counter() - started
+
+
+def frontend_level(generate, level, total):
+    """`total` calls of a blocking frontend helper from `level` threads."""
+    def one(i):
+        started = time.perf_counter()
+        first = []
+        output = generate(f"bench task {i}", "Python", on_first_token=lambda: first.append(time.perf_counter()))
+        ok = bool(output) and not output.startswith(ERROR_MARKERS)
+        ttft = first[0] - started if first else None
+        return {"ok": ok, "ttft": ttft, "latency": time.perf_counter() - started}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        samples = list(pool.map(one, range(total)))
+    return samples, time.perf_counter() - started
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def change(new, old):
+    if new is None or not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(current, previous_path):
+    previous = json.loads(Path(previous_path).read_text())
+    print(f"\nCompared with {previous_path} ({previous['meta'].get('commit')}):")
+    for target, levels in current["results"].items():
+        before = {row["concurrency"]: row for row in previous["results"].get(target, [])}
+        for row in levels:
+            old = before.get(row["concurrency"])
+            if not old:
+                continue
+            print(
+                f"  {target:16} c={row['concurrency']:<3} "
+                f"throughput {change(row['throughput_rps'], old['throughput_rps']):>8}  "
+                f"p95 latency {change(row['latency_ms']['p95'], old['latency_ms']['p95']):>8}  "
+                f"p95 ttft {change(row['ttft_ms']['p95'], old['ttft_ms']['p95']):>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend and frontend helpers.")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=3, help="requests per level = level * rounds")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"subset of {','.join(TARGETS)}")
+    parser.add_argument("--output", help="result JSON (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="previous result JSON to diff against")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+    targets = [target for target in args.targets.split(",") if target]
+    stub_config = stub_config_from_args(args)
+
+    stub_port = free_port()
+    stub = start_stub(stub_config, stub_port)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+
+    # The backend reads its config at import time; point it at the stub and
+    # keep the disk cache and sandbox pool out of the measurement.
+    os.environ["OLLAMA_BASE_URL"] = stub_url
+    os.environ["GENERATION_CACHE_PATH"] = ""
+    os.environ.setdefault("SANDBOX_WARM_WORKERS", "0")
+    os.environ.setdefault("SCHEDULER_MAX_QUEUE", str(max(levels) * args.rounds))
+    sys.path.insert(0, str(ROOT_DIR / "backend"))
+    sys.path.insert(0, str(ROOT_DIR / "frontend"))
+
+    results = {}
+    servers = []
+    try:
+        if "backend" in targets:
+            import model_client
+
+            backend_port = free_port()
+            servers.append(serve(model_client.app, backend_port))
+            results["backend"] = []
+            for level in levels:
+                samples, wall = asyncio.run(
+                    backend_level(f"http://127.0.0.1:{backend_port}", level, level * args.rounds)
+                )
+                results["backend"].append(summarize(level, samples, wall, stub.pid))
+                print("backend", json.dumps(results["backend"][-1]))
+
+        frontend = [target for target in targets if target.startswith("frontend")]
+        if frontend:
+            import generation
+
+            generation.OLLAMA_URL = f"{stub_url}/api/generate"
+            generation.HF_API_URL = f"{stub_url}/models/{stub_config.model}"
+            helpers = {"frontend_ollama": generation.generate_via_ollama, "frontend_hf": generation.generate_via_hf}
+            for target in frontend:
+                results[target] = []
+                for level in levels:
+                    samples, wall = frontend_level(helpers[target], level, level * args.rounds)
+                    results[target].append(summarize(level, samples, wall, stub.pid))
+                    print(target, json.dumps(results[target][-1]))
+    finally:
+        for server in servers:
+            server.should_exit = True
+        stub.terminate()
+        stub.wait()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "levels": levels,
+            "rounds": args.rounds,
+            "stub": asdict(stub_config),
+        },
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
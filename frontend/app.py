@@ -1,99 +1,217 @@
 import streamlit as st
-import requests
-import json
 import os
 
-from dotenv import load_dotenv
-from pathlib import Path
+# generation.py loads .env and puts the repo root on sys.path for `backend`
+from generation import (
+    HF_MODEL,
+    HF_PROMPT_TEMPLATE,
+    OLLAMA_MODEL,
+    OLLAMA_PROMPT_TEMPLATE,
+    generate_via_hf,
+    generate_via_ollama,
+    ollama_running,
+    refine_via_ollama,
+)
+from backend.cache import GenerationCache, make_key
+from backend.metrics import RequestTrace, start_http_server
+from backend.stream_parser import ScriptResponseParser, parse_script_response
 
-# Load .env file from one directory up (repo root)
-load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+from health import HealthMonitor, run_with_fallback
 
 # ---------------- CONFIG ----------------
-OLLAMA_URL = "https://nonvigilant-rubie-nondynamically.ngrok-free.dev/api/generate"
-OLLAMA_MODEL = "codellama:7b"
-
-# Small free model from Hugging Face for online demo
-HF_MODEL = os.getenv("HF_MODEL", "")
-HF_BASE_URL = os.getenv("HF_BASE_URL", "")
-HF_TOKEN = os.getenv("HF_API_KEY", "")
+# Backend health is probed in the background instead of on every click
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "15"))
+# Hedged mode: start the fallback if Ollama has no first token by then (seconds)
+HEDGE_AFTER = float(os.getenv("HEDGE_AFTER", "10"))
+# Optional Prometheus exporter for this Streamlit process (e.g. 9101)
+FRONTEND_METRICS_PORT = os.getenv("FRONTEND_METRICS_PORT", "")
 # ----------------------------------------
 
+# --- HELPER: Shared generation cache (one per Streamlit process) ---
+@st.cache_resource
+def get_generation_cache():
+    return GenerationCache()
 
-HF_API_URL = f"{HF_BASE_URL.rstrip('/')}/{HF_MODEL}"
-
-# --- HELPER: Detect if Ollama (via ngrok) is live ---
-def ollama_running():
-    try:
-        res = requests.get(OLLAMA_URL.replace("/api/generate", "/api/tags"), timeout=3)
-        return res.status_code == 200
-    except Exception:
-        return False
-
-# --- HELPER: Generate via Ollama ---
-def generate_via_ollama(prompt, language):
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": f"Generate a {language} script for this task:\n{prompt}\n"
-                  f"Respond with sections:\n"
-                  f"1. Problem\n2. Tech Used\n3. Libraries/Prerequisites\n4. Script Code\n"
-                  f"Format cleanly in Markdown."
-    }
-    try:
-        resp = requests.post(OLLAMA_URL, json=payload, stream=True, timeout=90)
-        text = ""
-        for line in resp.iter_lines():
-            if line:
-                data = json.loads(line.decode("utf-8"))
-                text += data.get("response", "")
-        return text.strip() or "⚠️ No response received from Ollama."
-    except Exception as e:
-        return f"❌ Ollama error: {e}"
-
-# --- HELPER: Generate via Hugging Face (fallback) ---
-def generate_via_hf(prompt, language):
-    headers = {"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else {}
-    payload = {
-        "inputs": f"Generate a {language} automation script for: {prompt}\n"
-                  f"Provide structured sections:\n"
-                  f"1. Problem\n2. Tech Used\n3. Libraries/Prerequisites\n4. Script Code"
-    }
-    try:
-        resp = requests.post(HF_API_URL, headers=headers, json=payload, timeout=90)
-        if resp.status_code == 200:
-            data = resp.json()
-            if isinstance(data, list) and len(data) and "generated_text" in data[0]:
-                return data[0]["generated_text"]
-            return str(data)
-        return f"⚠️ HF API Error {resp.status_code}: {resp.text}"
-    except Exception as e:
-        return f"❌ Hugging Face error: {e}"
+# --- HELPER: Background health monitor (one per Streamlit process) ---
+@st.cache_resource
+def get_health_monitor():
+    # HF has no cheap health endpoint; its breaker is driven by real requests.
+    probes = {"ollama": ollama_running, "hf": None}
+    return HealthMonitor(probes, interval=HEALTH_CHECK_INTERVAL).start()
+
+# --- HELPER: Metrics exporter (one per Streamlit process) ---
+@st.cache_resource
+def start_metrics_exporter(port):
+    return start_http_server(port)
+
+if FRONTEND_METRICS_PORT:
+    start_metrics_exporter(int(FRONTEND_METRICS_PORT))
+
+ERROR_MARKERS = ("❌", "⚠️")
+
+# name -> (model, prompt template, generator, banner shown when it served the request)
+BACKENDS = {
+    "ollama": (OLLAMA_MODEL, OLLAMA_PROMPT_TEMPLATE, generate_via_ollama,
+               "Using local Codellama model via Ollama (ngrok tunnel)."),
+    "hf": (HF_MODEL, HF_PROMPT_TEMPLATE, generate_via_hf, "Ollama not available. Used Hugging Face fallback."),
+}
+
+def is_ok(output):
+    return bool(output) and not output.startswith(ERROR_MARKERS)
+
+def generate(prompt, language, bypass=False, hedge=False):
+    """Returns (backend name, output, parsed sections, served from cache, stage
+    timings, Ollama context for refinements or None)."""
+    cache = get_generation_cache()
+    names = get_health_monitor().available(list(BACKENDS))
+    keys = {name: make_key(prompt, language, *BACKENDS[name][:2]) for name in names}
+    if not bypass:
+        trace = RequestTrace(names[0], language)
+        with trace.stage("cache_lookup"):
+            for name in names:
+                hit = cache.get(keys[name])
+                if hit is not None:
+                    break
+        if hit is not None:
+            trace.finish("cached")
+            return name, hit, parse_script_response(hit, language), True, trace.stages, None
+
+    # One parser and trace per backend so a hedged race never mixes two streams
+    parsers = {name: ScriptResponseParser(language) for name in names}
+    traces = {}  # filled as backends start, so unused ones open no span
+    # Ollama hands back its conversation context for follow-up refinements
+    sessions = {"ollama": {}}
+
+    def call(name):
+        def run(first, cancel):
+            traces[name] = RequestTrace(name, language)
+            extra = {"session": sessions[name]} if name in sessions else {}
+            output = BACKENDS[name][2](prompt, language, first, cancel, parsers[name], traces[name], **extra)
+            outcome = "cancelled" if cancel.is_set() else "ok" if is_ok(output) else "error"
+            traces[name].finish(outcome)
+            return output
+        return run
+
+    name, output = run_with_fallback(
+        get_health_monitor(), [(name, call(name)) for name in names], is_ok,
+        hedge_after=HEDGE_AFTER if hedge else None,
+    )
+    if not is_ok(output):
+        return name, output, None, False, traces[name].stages, None
+    cache.set(keys[name], output)
+    parser = parsers[name]
+    parsed = parser.result() if parser.done else parse_script_response(output, language)
+    return name, output, parsed, False, traces[name].stages, sessions.get(name, {}).get("context")
+
+def refine(previous, instruction, language, context):
+    """Apply a follow-up instruction to the last answer; same shape as generate().
+
+    Refinements always go to Ollama (reusing its context when there is one)
+    and are not cached, since they depend on the conversation so far.
+    """
+    parser = ScriptResponseParser(language)
+    trace = RequestTrace("ollama", language)
+    session = {}
+    output = refine_via_ollama(instruction, language, previous, context, parser=parser, trace=trace,
+                               session=session)
+    trace.finish("ok" if is_ok(output) else "error")
+    get_health_monitor().record("ollama", is_ok(output))
+    if not is_ok(output):
+        return "ollama", output, None, False, trace.stages, context
+    parsed = parser.result() if parser.done else parse_script_response(output, language)
+    return "ollama", output, parsed, False, trace.stages, session.get("context")
+
+FILE_EXTENSIONS = {"python": "py", "py": "py", "bash": "sh", "sh": "sh", "javascript": "js", "js": "js", "powershell": "ps1"}
+
+def render_script(parsed, output, language):
+    """Show the parsed sections; fall back to raw markdown if none were found."""
+    if parsed is None or not (parsed.problem or parsed.tech or parsed.code):
+        st.markdown(output)
+        return
+    for title, body in (("Problem", parsed.problem), ("Tech Used", parsed.tech),
+                        ("Libraries/Prerequisites", parsed.prerequisites)):
+        if body:
+            st.markdown(f"#### {title}")
+            st.markdown(body)
+    if parsed.code:
+        st.markdown("#### Script Code")
+        st.code(parsed.code, language=parsed.language or language.lower())
 
 # --- Streamlit UI ---
 st.title("🤖 AI Script Generator")
 st.caption("Generate automation scripts using your local Ollama or fallback model online.")
 
+with st.sidebar:
+    st.markdown("#### Backend status")
+    for backend, state in get_health_monitor().status().items():
+        st.caption(f"{backend}: {state}")
+
 prompt = st.text_area("💬 Describe the task:", placeholder="e.g., Automate file renaming in a folder")
 language = st.selectbox("💻 Select script language:", ["Python", "Bash", "JavaScript"])
+bypass_cache = st.checkbox("♻️ Bypass cache (force a fresh generation)")
+hedge = st.checkbox(f"🏁 Hedged mode (start fallback if no output after {HEDGE_AFTER:g}s)")
+
+def show_result(last):
+    backend = last["backend"]
+    if backend == "ollama":
+        st.info(BACKENDS[backend][3])
+    else:
+        st.warning(BACKENDS[backend][3])
+    if last["cached"]:
+        st.caption("⚡ Served from cache.")
+    if last["turns"] > 1:
+        st.caption(f"🔁 Refinement {last['turns'] - 1}")
+
+    with st.expander("⏱️ Timings"):
+        st.table({stage: f"{seconds * 1000:.0f} ms" for stage, seconds in last["timings"].items()})
+
+    st.markdown("### ✅ Generated Output")
+    output, parsed, language = last["output"], last["parsed"], last["language"]
+    render_script(parsed, output, language)
+
+    if parsed is not None and parsed.code:
+        extension = FILE_EXTENSIONS.get(parsed.language or language.lower(), "txt")
+        data, file_name = parsed.code, f"generated_{language.lower()}.{extension}"
+    else:
+        data, file_name = output, f"generated_{language.lower()}.txt"
+    st.download_button(
+        label="💾 Download Script",
+        data=data,
+        file_name=file_name,
+        mime="text/plain",
+    )
+
+def remember(result, language, turns):
+    backend, output, parsed, cached, timings, context = result
+    # Kept across reruns so the refine box can build on the last answer
+    st.session_state["last"] = {
+        "backend": backend, "output": output, "parsed": parsed, "cached": cached,
+        "timings": timings, "context": context, "language": language, "turns": turns,
+    }
 
 if st.button("🚀 Generate Script"):
     if not prompt.strip():
         st.warning("Please enter a task description.")
     else:
         with st.spinner("Generating your script... ⏳"):
-            if ollama_running():
-                st.info("Using local Codellama model via Ollama (ngrok tunnel).")
-                output = generate_via_ollama(prompt, language)
+            remember(generate(prompt, language, bypass_cache, hedge), language, turns=1)
+
+last = st.session_state.get("last")
+if last is not None and is_ok(last["output"]):
+    instruction = st.text_input("✏️ Refine the script:", placeholder="e.g., Add logging and a --dry-run flag")
+    if st.button("🔁 Refine"):
+        if not instruction.strip():
+            st.warning("Please enter a refinement.")
+        elif "ollama" not in get_health_monitor().available(list(BACKENDS)):
+            st.warning("Refinements need Ollama, which is not available right now.")
+        else:
+            with st.spinner("Refining your script... ⏳"):
+                result = refine(last["output"], instruction, last["language"], last["context"])
+            if is_ok(result[1]):
+                remember(result, last["language"], turns=last["turns"] + 1)
+                last = st.session_state["last"]
             else:
-                st.warning("Ollama not detected. Using Hugging Face fallback.")
-                output = generate_via_hf(prompt, language)
-
-            st.markdown("### ✅ Generated Output")
-            st.markdown(output)
-
-            st.download_button(
-                label="💾 Download Script",
-                data=output,
-                file_name=f"generated_{language.lower()}.txt",
-                mime="text/plain",
-            )
+                st.error(result[1])  # keep the previous script on screen
+
+if last is not None:
+    show_result(last)
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+
+import requests
+from dotenv import load_dotenv
+from pathlib import Path
+
+# Model-calling helpers used by the Streamlit app. They live outside app.py so
+# they can be imported (e.g. by bench/) without rendering the UI.
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# Load .env file from one directory up (repo root)
+load_dotenv(ROOT_DIR / ".env")
+
+# Make the shared `backend` helpers importable when run via `streamlit run`
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+from backend.metrics import RequestTrace, observe_stage
+from backend.stream_parser import ScriptResponseParser, loads
+
+# ---------------- CONFIG ----------------
+OLLAMA_URL = "https://nonvigilant-rubie-nondynamically.ngrok-free.dev/api/generate"
+OLLAMA_MODEL = "codellama:7b"
+# (connect, read) timeouts: a dead tunnel fails fast, a slow model may think
+OLLAMA_TIMEOUT = (float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3")), float(os.getenv("OLLAMA_READ_TIMEOUT", "90")))
+# Keep the model loaded between requests so refinements skip the cold load
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Small free model from Hugging Face for online demo
+HF_MODEL = os.getenv("HF_MODEL", "")
+HF_BASE_URL = os.getenv("HF_BASE_URL", "")
+HF_TOKEN = os.getenv("HF_API_KEY", "")
+HF_TIMEOUT = (float(os.getenv("HF_CONNECT_TIMEOUT", "5")), float(os.getenv("HF_READ_TIMEOUT", "90")))
+
+# Prompt templates; each is part of its backend's cache key
+OLLAMA_PROMPT_TEMPLATE = (
+    "Generate a {language} script for this task:\n{prompt}\n"
+    "Respond with sections:\n"
+    "1. Problem\n2. Tech Used\n3. Libraries/Prerequisites\n4. Script Code\n"
+    "Format cleanly in Markdown."
+)
+HF_PROMPT_TEMPLATE = (
+    "Generate a {language} automation script for: {prompt}\n"
+    "Provide structured sections:\n"
+    "1. Problem\n2. Tech Used\n3. Libraries/Prerequisites\n4. Script Code"
+)
+# ----------------------------------------
+
+
+HF_API_URL = f"{HF_BASE_URL.rstrip('/')}/{HF_MODEL}"
+
+# --- HELPER: Detect if Ollama (via ngrok) is live ---
+def ollama_running():
+    started = time.perf_counter()
+    try:
+        res = requests.get(OLLAMA_URL.replace("/api/generate", "/api/tags"), timeout=3)
+        return res.status_code == 200
+    except Exception:
+        return False
+    finally:
+        observe_stage("health_probe", time.perf_counter() - started, backend="ollama")
+
+def keep_alive():
+    try:
+        return int(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE
+
+# --- HELPER: Generate via Ollama ---
+def generate_via_ollama(prompt, language, on_first_token=None, cancel=None, parser=None, trace=None,
+                        session=None):
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": OLLAMA_PROMPT_TEMPLATE.format(language=language, prompt=prompt),
+        "keep_alive": keep_alive(),
+    }
+    return stream_ollama(payload, language, on_first_token, cancel, parser, trace, session)
+
+# --- HELPER: Refine the previous answer via Ollama ---
+def refine_via_ollama(instruction, language, previous, context=None, on_first_token=None, parser=None,
+                      trace=None, session=None):
+    """With Ollama's `context` from the last turn only the instruction is sent;
+    without it the previous answer is quoted in the prompt instead."""
+    if context:
+        prompt = f"Update the {language} script above: {instruction}"
+    else:
+        prompt = f"Here is a {language} script:\n{previous}\n\nUpdate it: {instruction}"
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "keep_alive": keep_alive()}
+    if context:
+        payload["context"] = context
+    return stream_ollama(payload, language, on_first_token, None, parser, trace, session)
+
+def stream_ollama(payload, language, on_first_token=None, cancel=None, parser=None, trace=None, session=None):
+    """Stream one Ollama generation; the final `context` is stored in `session`."""
+    # The parser buffers tokens and splits out sections/code as they stream in
+    parser = parser or ScriptResponseParser(language)
+    trace = trace or RequestTrace("ollama", language)
+    decode = 0.0
+    try:
+        with trace.stage("connect"):
+            resp = requests.post(OLLAMA_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT)
+        with resp:
+            for line in resp.iter_lines():
+                if cancel is not None and cancel.is_set():
+                    break  # another backend already answered; drop the stream
+                if line:
+                    decoding = time.perf_counter()
+                    data = loads(line)
+                    decode += time.perf_counter() - decoding
+                    token = data.get("response", "")
+                    if token:
+                        parser.feed_text(token)
+                        trace.first_token()
+                        if on_first_token is not None:
+                            on_first_token()
+                            on_first_token = None
+                    if data.get("done"):
+                        trace.ollama_stats(data)
+                        if session is not None:
+                            session["context"] = data.get("context")
+        parser.close()
+        trace.add("json_decode", decode)
+        return parser.text.strip() or "⚠️ No response received from Ollama."
+    except Exception as e:
+        return f"❌ Ollama error: {e}"
+
+# --- HELPER: Generate via Hugging Face (fallback) ---
+def generate_via_hf(prompt, language, on_first_token=None, cancel=None, parser=None, trace=None):
+    headers = {"Authorization": f"Bearer {HF_TOKEN}"} if HF_TOKEN else {}
+    payload = {
+        "inputs": HF_PROMPT_TEMPLATE.format(language=language, prompt=prompt)
+    }
+    trace = trace or RequestTrace("hf", language)
+    try:
+        # HF answers in one piece: the whole call is "generation"
+        with trace.stage("generation"):
+            resp = requests.post(HF_API_URL, headers=headers, json=payload, timeout=HF_TIMEOUT)
+        # The whole answer arrives at once, so that is also the first token
+        trace.first_token()
+        if on_first_token is not None and resp.status_code == 200:
+            on_first_token()
+        if resp.status_code == 200:
+            with trace.stage("json_decode"):
+                data = resp.json()
+            if isinstance(data, list) and len(data) and "generated_text" in data[0]:
+                text = data[0]["generated_text"]
+                if parser is not None:
+                    parser.feed_text(text)
+                    parser.close()
+                return text
+            return str(data)
+        return f"⚠️ HF API Error {resp.status_code}: {resp.text}"
+    except Exception as e:
+        return f"❌ Hugging Face error: {e}"
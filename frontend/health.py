@@ -0,0 +1,193 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Backend health tracking for the Streamlit app. Probes run on a background
+# thread and only update in-memory state, so picking a backend on the request
+# path is a couple of attribute reads instead of a network round trip.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+
+    While open, the backend is skipped. After `reset_timeout` seconds it turns
+    half-open and exactly one caller (a background probe or a real request)
+    is let through as the trial: success closes the breaker, failure re-opens
+    it for another `reset_timeout`. Everyone else keeps skipping the backend
+    meanwhile. A trial that never reports back (the caller picked another
+    backend) is given up after `reset_timeout` and the next caller tries.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = None  # monotonic time of the in-flight half-open trial
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.trial_started = None
+            if self.state == HALF_OPEN:
+                if self.trial_started is not None and now - self.trial_started < self.reset_timeout:
+                    return False
+                self.trial_started = now
+            return self.state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.trial_started = None
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def trip(self):
+        """Open immediately, e.g. when a health probe says the backend is down."""
+        with self._lock:
+            self.failures = max(self.failures + 1, self.failure_threshold)
+            self.trial_started = None
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class HealthMonitor:
+    """Probes every backend every `interval` seconds on a daemon thread.
+
+    `probes` maps backend name -> callable returning True when healthy, or
+    None for backends without a cheap health check (those are judged only
+    by the outcome of real requests). A failed probe opens the breaker right
+    away; failed requests count towards `failure_threshold`, since they can
+    also fail for reasons specific to one prompt.
+    """
+
+    def __init__(self, probes, interval=15.0, failure_threshold=3, reset_timeout=30.0):
+        self.probes = probes
+        self.interval = interval
+        self.breakers = {
+            name: CircuitBreaker(name, failure_threshold, reset_timeout) for name in probes
+        }
+        self.last_checked = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.interval)
+
+    def check_all(self):
+        for name, probe in self.probes.items():
+            breaker = self.breakers[name]
+            # An open breaker is only probed once its reset timeout expires.
+            if probe is None or not breaker.allow():
+                continue
+            try:
+                healthy = bool(probe())
+            except Exception:
+                healthy = False
+            if healthy:
+                breaker.record_success()
+            else:
+                breaker.trip()
+            self.last_checked[name] = time.time()
+
+    def record(self, name, ok):
+        if ok:
+            self.breakers[name].record_success()
+        else:
+            self.breakers[name].record_failure()
+
+    def available(self, preference):
+        """Backends from `preference` whose breaker is not open, in order.
+
+        Falls back to the full list when everything looks down; there is
+        nothing to lose by trying.
+        """
+        names = [name for name in preference if self.breakers[name].allow()]
+        return names or list(preference)
+
+    def status(self):
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+
+def run_with_fallback(monitor, calls, is_ok, hedge_after=None):
+    """Run `calls` ([(name, fn), ...] in preference order) until one succeeds.
+
+    Each `fn(on_first_token, cancel)` returns a result; it should call
+    `on_first_token()` once output starts and stop early when `cancel` is set.
+    Without `hedge_after`, backends are tried one after another. With it, the
+    next backend is started as soon as the current one has failed *or* has
+    not produced a first token within `hedge_after` seconds, and the first
+    successful result wins. Outcomes feed the monitor's circuit breakers.
+
+    Returns (name, result) of the winner, or of the last failure. Losers that
+    are still blocked waiting for their first byte keep only their own thread
+    (bounded by the read timeout); the pool is per call, so a stalled backend
+    cannot starve other sessions.
+    """
+    cancel = threading.Event()
+    pending = {}
+    last = (None, None)
+    executor = ThreadPoolExecutor(max_workers=max(1, len(calls)), thread_name_prefix="hedge")
+
+    def start(name, fn):
+        progressed = threading.Event()
+        future = executor.submit(fn, progressed.set, cancel)
+        future.add_done_callback(lambda _: progressed.set())
+        pending[future] = name
+        return progressed
+
+    try:
+        remaining = list(calls)
+        while remaining or pending:
+            if remaining:
+                progressed = start(*remaining.pop(0))
+                # Hedge: if the newest backend has neither output nor an outcome
+                # within the budget, start the next one racing it.
+                if hedge_after is not None and remaining and not progressed.wait(hedge_after):
+                    continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = e
+                ok = not isinstance(result, Exception) and is_ok(result)
+                monitor.record(name, ok)
+                if ok:
+                    cancel.set()
+                    return name, result
+                last = (name, result)
+        if isinstance(last[1], Exception):
+            return last[0], f"❌ {last[0]} error: {last[1]}"
+        return last
+    finally:
+        # Don't wait for losers; they stop at their next line or time out.
+        executor.shutdown(wait=False)
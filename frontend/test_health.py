@@ -0,0 +1,157 @@
+import threading
+import time
+
+from health import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, HealthMonitor, run_with_fallback
+
+# Unit tests for the circuit breakers and hedged fallback; stdlib only:
+#   python -m pytest frontend/test_health.py
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    return clock
+
+
+def test_opens_after_threshold_and_closes_on_success():
+    breaker = CircuitBreaker("ollama", failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+
+def test_half_open_lets_exactly_one_trial_through(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    breaker = CircuitBreaker("ollama", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()  # the trial
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens_for_another_timeout(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    breaker = CircuitBreaker("ollama", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_abandoned_trial_is_retried_after_timeout(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    breaker = CircuitBreaker("hf", failure_threshold=1, reset_timeout=30)
+    breaker.trip()
+    clock.now += 30
+    assert breaker.allow()  # trial claimed but never reported
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_failed_probe_trips_at_once():
+    healthy = [False]
+    monitor = HealthMonitor({"ollama": lambda: healthy[0], "hf": None})
+    monitor.check_all()
+    assert monitor.status() == {"ollama": OPEN, "hf": CLOSED}
+    assert monitor.available(["ollama", "hf"]) == ["hf"]
+
+
+def test_available_falls_back_to_everything_when_all_are_open():
+    monitor = HealthMonitor({"ollama": None, "hf": None})
+    for name in ("ollama", "hf"):
+        monitor.breakers[name].trip()
+    assert monitor.available(["ollama", "hf"]) == ["ollama", "hf"]
+
+
+def backend(result, delay=0.0, first_token_after=None):
+    """A fake backend call for run_with_fallback."""
+    def call(on_first_token, cancel):
+        if first_token_after is not None:
+            time.sleep(first_token_after)
+            on_first_token()
+        if cancel.wait(delay):
+            return "cancelled"
+        return result
+    return call
+
+
+def test_sequential_fallback_records_outcomes():
+    monitor = HealthMonitor({"ollama": None, "hf": None}, failure_threshold=1)
+    name, result = run_with_fallback(
+        monitor, [("ollama", backend("❌ down")), ("hf", backend("script"))], lambda r: r == "script",
+    )
+    assert (name, result) == ("hf", "script")
+    assert monitor.status() == {"ollama": OPEN, "hf": CLOSED}
+
+
+def test_hedge_starts_fallback_when_primary_is_silent():
+    monitor = HealthMonitor({"ollama": None, "hf": None})
+    cancelled = threading.Event()
+
+    def silent(on_first_token, cancel):
+        cancel.wait(5)
+        cancelled.set()
+        return "cancelled"
+
+    started = time.monotonic()
+    name, result = run_with_fallback(
+        monitor, [("ollama", silent), ("hf", backend("script"))], lambda r: r == "script", hedge_after=0.05,
+    )
+    assert (name, result) == ("hf", "script")
+    assert time.monotonic() - started < 1
+    assert cancelled.wait(1)  # the loser is told to stop
+
+
+def test_no_hedge_once_the_primary_is_streaming():
+    monitor = HealthMonitor({"ollama": None, "hf": None})
+    calls = []
+
+    def fallback(on_first_token, cancel):
+        calls.append("hf")
+        return "fallback"
+
+    name, result = run_with_fallback(
+        monitor,
+        [("ollama", backend("script", delay=0.2, first_token_after=0.01)), ("hf", fallback)],
+        lambda r: r in ("script", "fallback"),
+        hedge_after=0.05,
+    )
+    assert (name, result) == ("ollama", "script")
+    assert calls == []
+
+
+def test_all_failures_return_the_last_error():
+    monitor = HealthMonitor({"ollama": None, "hf": None})
+
+    def broken(on_first_token, cancel):
+        raise RuntimeError("boom")
+
+    name, result = run_with_fallback(
+        monitor, [("ollama", backend("❌ down")), ("hf", broken)], lambda r: False,
+    )
+    assert name == "hf"
+    assert result == "❌ hf error: boom"